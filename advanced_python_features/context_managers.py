@@ -29,6 +29,20 @@ with Timer("Elapsed time to compute prime numbers ranging from 2 to 500: {}ms"):
             primes.append(x)
         print("Primes: {}".format(primes))
 
+# profiler.py grows Timer into named spans that nest, even across threads and
+# asyncio tasks, and adds up their times per call path:
+import profiler
+
+profiler.enable()
+with profiler.span("primes", "Elapsed time for primes up to 5000: {:.3f}ms"):
+    primes = []
+    for x in range(2, 5000):
+        with profiler.span("trial division"):
+            if not any(x % p == 0 for p in primes):
+                primes.append(x)
+print(profiler.report())
+profiler.disable()
+
 # For simple use cases, it's possible to use a generator function with a single
 # yield call, using the @contextmanager decorator:
 from contextlib import contextmanager
@@ -41,3 +41,51 @@ def fibonacci(n):
     return fibonacci(n-1) + fibonacci(n-2)
 
 print([fibonacci(n) for n in range(1, 9)])
+print()
+
+# cache() above never forgets anything, ignores keyword arguments and isn't
+# safe to share between threads. memoize.py has a bounded, thread-safe
+# version with LRU, LFU or TTL eviction and hit/miss statistics:
+from memoize import memoize
+
+@memoize(maxsize=4, policy="lru")
+def fibonacci(n):
+    print('calling fibonacci(%d)' % n)
+    if n < 2:
+        return n
+    return fibonacci(n=n-1) + fibonacci(n-2) # n=... and n share a cache entry
+
+print([fibonacci(n) for n in range(1, 9)])
+print(fibonacci.cache_info())
+print()
+
+# Both caches above are lost when the program exits. persistent_memoize.py
+# keeps results in a sqlite file as well, so the next run finds them there:
+from persistent_memoize import persistent_memoize
+
+@persistent_memoize(maxsize=4)
+def slow_square(n):
+    print('calling slow_square(%d)' % n)
+    return n * n
+
+print([slow_square(n) for n in range(1, 5)]) # computed only on the first run
+print(slow_square.disk_info())
+print()
+
+# cache() on an async function would store the coroutine object, which can
+# only be awaited once. amemoize caches the awaited result instead, and
+# concurrent awaits of the same arguments share a single call:
+import asyncio
+from memoize import amemoize
+
+@amemoize(maxsize=128, ttl=60)
+async def fetch_price(symbol):
+    print('fetching %s' % symbol)
+    await asyncio.sleep(0.1)
+    return len(symbol) * 100
+
+async def many_requests():
+    return await asyncio.gather(*[fetch_price('AAPL') for _ in range(10)])
+
+print(asyncio.run(many_requests())) # fetches once
+print(fetch_price.cache_info())
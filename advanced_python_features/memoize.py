@@ -0,0 +1,346 @@
+"""
+A bounded, thread-safe version of the cache() decorator from decorators.py.
+
+cache() keeps every result forever, keys them on *args only and has no
+locking, so in a long-running program it grows without end and two threads
+that miss on the same arguments both compute the result.
+memoize() bounds the cache by entries and/or bytes, evicts by one of three
+policies, builds keys from the bound arguments (so f(1, b=2), f(1, 2) and
+f(b=2, a=1) share one entry), and lets only one thread compute a missing
+key while the others wait for its result.
+
+-->
+>> from memoize import memoize
+>> @memoize(maxsize=1000, policy="lru", ttl=60, max_bytes=10**6)
+.. def quote(symbol, day=None):
+..     ...
+>> quote.cache_info()
+CacheInfo(hits=3, misses=1, evictions=0, maxsize=1000, currsize=1, nbytes=56)
+>> quote.cache_clear()
+-->
+
+Policies:
+    "lru"  evicts the entry used least recently
+    "lfu"  evicts the entry used least often (least recently among ties)
+    "ttl"  evicts the entry that expires first (the oldest one)
+With ttl (seconds) set, entries also expire that long after they were
+stored, whatever the policy.
+A value's size is sys.getsizeof(value) unless sizeof is given; a value
+bigger than max_bytes by itself is returned but not kept.
+
+amemoize() does the same for coroutine functions, caching the awaited
+results rather than the coroutine objects (which can only be awaited
+once). Concurrent awaits of a missing key share one task:
+
+-->
+>> @amemoize(maxsize=1000, ttl=30)
+.. async def fetch(url):
+..     ...
+>> await asyncio.gather(*[fetch(url) for _ in range(100)])   # one request
+-->
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from functools import update_wrapper
+from weakref import WeakKeyDictionary
+from inspect import Parameter, iscoroutinefunction, signature
+
+CacheInfo = namedtuple("CacheInfo", "hits misses evictions maxsize currsize "
+                                    "nbytes")
+POLICIES = ("lru", "lfu", "ttl")
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires", "count")
+
+    def __init__(self, value, size, expires):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.count = 1
+
+
+class _Store:
+    """
+    The entries of one memoized function and their eviction order.
+    Not locked itself: every method is called with the memoizer's lock held.
+    """
+    def __init__(self, policy, maxsize, max_bytes):
+        self.policy = policy
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        # Eviction order for "lru" and "ttl", least wanted first; "lfu"
+        # keeps one such order per use count instead.
+        self.entries = OrderedDict()
+        self.by_count = {}
+        self.min_count = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires is not None and entry.expires <= now:
+            self.remove(key)
+            return None
+        if self.policy == "lru":
+            self.entries.move_to_end(key)
+        elif self.policy == "lfu":
+            bucket = self.by_count[entry.count]
+            del bucket[key]
+            if not bucket:
+                del self.by_count[entry.count]
+                if self.min_count == entry.count:
+                    self.min_count += 1
+            entry.count += 1
+            self.by_count.setdefault(entry.count, OrderedDict())[key] = None
+        return entry
+
+    def put(self, key, entry, now):
+        if key in self.entries:
+            self.remove(key)
+        if self.maxsize == 0 or \
+                (self.max_bytes is not None and entry.size > self.max_bytes):
+            return
+        if self.policy == "ttl":
+            # Entries are in expiry order, so the expired ones are in front.
+            while self.entries:
+                first = next(iter(self.entries.values()))
+                if first.expires is None or first.expires > now:
+                    break
+                self.remove(next(iter(self.entries)))
+        # Make room before adding the entry, so that it can't be its own
+        # victim (under "lfu" it would be, having the lowest count).
+        while self.entries and (
+                (self.maxsize is not None
+                 and len(self.entries) >= self.maxsize)
+                or (self.max_bytes is not None
+                    and self.nbytes + entry.size > self.max_bytes)):
+            self.remove(self.victim())
+            self.evictions += 1
+        self.entries[key] = entry
+        self.nbytes += entry.size
+        if self.policy == "lfu":
+            self.by_count.setdefault(1, OrderedDict())[key] = None
+            self.min_count = 1
+
+    def victim(self):
+        if self.policy != "lfu":
+            return next(iter(self.entries))
+        if self.min_count not in self.by_count:
+            self.min_count = min(self.by_count)
+        return next(iter(self.by_count[self.min_count]))
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.nbytes -= entry.size
+        if self.policy == "lfu":
+            bucket = self.by_count[entry.count]
+            del bucket[key]
+            if not bucket:
+                del self.by_count[entry.count]
+
+    def clear(self):
+        self.entries.clear()
+        self.by_count.clear()
+        self.nbytes = 0
+
+
+def _make_key_function(function, typed):
+    """
+    Returns a function of (args, kwargs) giving the cache key of a call:
+    the value of every parameter in order, defaults filled in.
+    """
+    sig = signature(function)
+    params = list(sig.parameters.values())
+    simple = all(p.kind == Parameter.POSITIONAL_OR_KEYWORD for p in params)
+    count = len(params)
+    var_keyword = [p.name for p in params if p.kind == Parameter.VAR_KEYWORD]
+
+    def make_key(args, kwargs):
+        if simple and not kwargs and len(args) == count:
+            # The common case needs no binding: args already are the values.
+            key = args
+        else:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            for name in var_keyword:
+                arguments[name] = tuple(sorted(arguments[name].items()))
+            key = tuple(arguments.values())
+        if typed:
+            key += tuple(type(value) for value in key)
+        return key
+    return make_key
+
+
+def memoize(function=None, maxsize=128, policy="lru", ttl=None,
+            max_bytes=None, typed=False, sizeof=sys.getsizeof, key=None):
+    """
+    Decorator caching the results of a function; use it as @memoize or
+    @memoize(maxsize=..., ...).
+    maxsize (entries) and max_bytes can each be None for no limit.
+    With typed, arguments of different types (1 and 1.0) are cached
+    separately.
+    key, if given, replaces the usual cache key: it is called as
+    key(args, kwargs) and returns any hashable value.
+    The wrapper gets cache_info() and cache_clear(); calls that waited for
+    another thread's result count as hits.
+    """
+    if policy not in POLICIES:
+        raise ValueError("policy must be one of {0}".format(POLICIES))
+    if function is None:
+        return lambda function: memoize(function, maxsize, policy, ttl,
+                                        max_bytes, typed, sizeof, key)
+
+    make_key = key or _make_key_function(function, typed)
+    store = _Store(policy, maxsize, max_bytes)
+    lock = threading.Lock()
+    # Keys being computed -> (Future of the result, computing thread):
+    in_flight = {}
+    stats = {"hits": 0, "misses": 0}
+
+    def wrapper(*args, **kwargs):
+        key = make_key(args, kwargs)
+        now = time.monotonic()
+        with lock:
+            entry = store.get(key, now)
+            if entry is not None:
+                stats["hits"] += 1
+                return entry.value
+            flight = in_flight.get(key)
+            if flight is None:
+                future = Future()
+                in_flight[key] = (future, threading.get_ident())
+                stats["misses"] += 1
+            elif flight[1] == threading.get_ident():
+                # The function called itself with the same arguments; waiting
+                # for ourselves would never end, so just compute.
+                stats["misses"] += 1
+            else:
+                stats["hits"] += 1
+        if flight is not None:
+            if flight[1] == threading.get_ident():
+                return function(*args, **kwargs)
+            return flight[0].result()
+
+        # Whatever fails (the function, sizeof or the store), the key must
+        # leave in_flight and the future be resolved, or every later caller
+        # of the key would wait on it forever.
+        try:
+            value = function(*args, **kwargs)
+            expires = None if ttl is None else time.monotonic() + ttl
+            entry = _Entry(value, sizeof(value), expires)
+            with lock:
+                store.put(key, entry, time.monotonic())
+                del in_flight[key]
+        except BaseException as error:
+            with lock:
+                in_flight.pop(key, None)
+            # Waiting threads get the same exception; nothing is cached.
+            future.set_exception(error)
+            raise
+        future.set_result(value)
+        return value
+
+    def cache_info():
+        with lock:
+            return CacheInfo(stats["hits"], stats["misses"], store.evictions,
+                             maxsize, len(store), store.nbytes)
+
+    def cache_clear():
+        with lock:
+            store.clear()
+            store.evictions = 0
+            stats["hits"] = stats["misses"] = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    return update_wrapper(wrapper, function)
+
+
+def amemoize(function=None, maxsize=128, policy="lru", ttl=None,
+             max_bytes=None, typed=False, sizeof=sys.getsizeof, key=None):
+    """
+    memoize() for coroutine functions; use it as @amemoize or
+    @amemoize(maxsize=..., ...), with the same options.
+    A miss starts one task computing the result, and every await of that
+    key until it finishes waits for the same task (and counts as a hit).
+    Each waiter awaits it through asyncio.shield, so cancelling one waiter
+    doesn't cancel the others' result. Exceptions reach every waiter and
+    aren't cached.
+    """
+    if policy not in POLICIES:
+        raise ValueError("policy must be one of {0}".format(POLICIES))
+    if function is None:
+        return lambda function: amemoize(function, maxsize, policy, ttl,
+                                         max_bytes, typed, sizeof, key)
+    if not iscoroutinefunction(function):
+        raise TypeError("amemoize needs a coroutine function; use memoize")
+
+    make_key = key or _make_key_function(function, typed)
+    store = _Store(policy, maxsize, max_bytes)
+    # The store may be shared by event loops in several threads:
+    lock = threading.Lock()
+    # Per event loop, keys being computed -> their task:
+    in_flight = WeakKeyDictionary()
+    stats = {"hits": 0, "misses": 0}
+
+    async def compute(key, tasks, args, kwargs):
+        try:
+            value = await function(*args, **kwargs)
+        finally:
+            del tasks[key]
+        expires = None if ttl is None else time.monotonic() + ttl
+        with lock:
+            store.put(key, _Entry(value, sizeof(value), expires),
+                      time.monotonic())
+        return value
+
+    async def wrapper(*args, **kwargs):
+        key = make_key(args, kwargs)
+        with lock:
+            entry = store.get(key, time.monotonic())
+            if entry is not None:
+                stats["hits"] += 1
+                return entry.value
+        tasks = in_flight.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        if task is not None and task is asyncio.current_task():
+            # The function awaited itself with the same arguments.
+            with lock:
+                stats["misses"] += 1
+            return await function(*args, **kwargs)
+        with lock:
+            stats["misses" if task is None else "hits"] += 1
+        if task is None:
+            task = asyncio.ensure_future(compute(key, tasks, args, kwargs))
+            tasks[key] = task
+            # Nobody may be left to see an exception if every waiter was
+            # cancelled; retrieve it so asyncio doesn't log it as lost.
+            task.add_done_callback(
+                lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(task)
+
+    def cache_info():
+        with lock:
+            return CacheInfo(stats["hits"], stats["misses"], store.evictions,
+                             maxsize, len(store), store.nbytes)
+
+    def cache_clear():
+        with lock:
+            store.clear()
+            store.evictions = 0
+            stats["hits"] = stats["misses"] = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    return update_wrapper(wrapper, function)
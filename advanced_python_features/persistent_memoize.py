@@ -0,0 +1,232 @@
+"""
+Memoization that survives restarts: the in-memory memoize() from memoize.py
+in front of a results table in a sqlite file.
+
+-->
+>> from persistent_memoize import persistent_memoize
+>> @persistent_memoize(path="results.sqlite", maxsize=1000)
+.. def simulate(n, seed=0):
+..     ...
+>> simulate(10**6)      # computed, and stored in memory and on disk
+>> simulate(10**6)      # from memory
+   (restart)
+>> simulate(10**6)      # from disk
+>> simulate.cache_info(), simulate.disk_info()
+-->
+
+Every result is stored under a SHA-256 hash of the function's module and
+qualified name, a fingerprint of its code (bytecode, constants, names and
+any nested functions), and the call's arguments bound to its parameters.
+Changing the function's code changes the fingerprint, so its old results
+are never returned, and they are deleted the first time the new code looks
+anything up.
+
+Arguments are encoded in a canonical form (dict and set items sorted,
+arrays by dtype, shape and bytes), so equal arguments hash the same in
+every process; other objects fall back to pickle, which is only stable if
+their state is.
+Values must be picklable.
+
+Several threads and processes can share one file: each thread of each
+process has its own connection, and the database runs in WAL mode with a
+busy timeout, so readers don't block the writer.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import struct
+import tempfile
+import threading
+from functools import update_wrapper
+from types import CodeType
+
+from memoize import memoize, _make_key_function
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "memoize.sqlite")
+BUSY_TIMEOUT_MS = 30000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    function TEXT NOT NULL,
+    code_hash TEXT NOT NULL,
+    value BLOB NOT NULL
+)"""
+_INDEX = "CREATE INDEX IF NOT EXISTS results_function ON results (function)"
+
+
+def _canonical(value, out):
+    """
+    Appends a byte encoding of value to the list out that is the same in
+    every process for equal values of the common types.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        out.append(b"n" + repr((type(value).__name__, value)).encode())
+    elif isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+        out.append(b"s" + struct.pack("<Q", len(data)) + data)
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(b"b" + struct.pack("<Q", len(value)) + bytes(value))
+    elif isinstance(value, (tuple, list)):
+        out.append(b"t" if isinstance(value, tuple) else b"l")
+        out.append(struct.pack("<Q", len(value)))
+        for item in value:
+            _canonical(item, out)
+    elif isinstance(value, (dict, set, frozenset)):
+        if isinstance(value, dict):
+            items = [_encode((k, v)) for k, v in value.items()]
+        else:
+            items = [_encode(item) for item in value]
+        out.append(b"d" if isinstance(value, dict) else b"e")
+        out.append(struct.pack("<Q", len(items)))
+        out.extend(sorted(items))
+    elif isinstance(value, CodeType):
+        out.append(b"c")
+        out.append(value.co_code)
+        _canonical((value.co_consts, value.co_names, value.co_varnames,
+                    value.co_argcount, value.co_kwonlyargcount,
+                    value.co_flags), out)
+    elif hasattr(value, "dtype") and hasattr(value, "tobytes"):
+        # numpy arrays and scalars:
+        out.append(b"a" + repr((str(value.dtype), getattr(value, "shape",
+                                                           ()))).encode())
+        if value.dtype.hasobject:
+            # The bytes of an object array are pointers, so encode the
+            # elements themselves.
+            _canonical(value.tolist(), out)
+        else:
+            data = value.tobytes()
+            out.append(struct.pack("<Q", len(data)) + data)
+    else:
+        data = pickle.dumps(value, protocol=4)
+        out.append(b"p" + struct.pack("<Q", len(data)) + data)
+
+
+def _encode(value):
+    out = []
+    _canonical(value, out)
+    return b"".join(out)
+
+
+def code_fingerprint(function):
+    """
+    Returns a hex digest that changes whenever the code of function does.
+    """
+    return hashlib.sha256(_encode(function.__code__)).hexdigest()
+
+
+class DiskStore:
+    """
+    The sqlite table of results, with one connection per thread per process.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        local = self._local
+        # A connection can't be used after fork(), so processes don't share:
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS
+                                         / 1000, isolation_level=None)
+            connection.execute("PRAGMA busy_timeout = %d" % BUSY_TIMEOUT_MS)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute(_SCHEMA)
+            connection.execute(_INDEX)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def get(self, key):
+        """
+        Returns (True, value) for a stored key, else (False, None).
+        """
+        row = self.connection().execute(
+            "SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False, None
+        return True, pickle.loads(row[0])
+
+    def put(self, key, function, code_hash, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection().execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            (key, function, code_hash, sqlite3.Binary(data)))
+
+    def purge(self, function, code_hash):
+        """
+        Deletes the results of other versions of function.
+        """
+        self.connection().execute(
+            "DELETE FROM results WHERE function = ? AND code_hash != ?",
+            (function, code_hash))
+
+    def clear(self, function):
+        self.connection().execute("DELETE FROM results WHERE function = ?",
+                                  (function,))
+
+    def count(self, function):
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM results WHERE function = ?",
+            (function,)).fetchone()[0]
+
+
+def persistent_memoize(function=None, path=DEFAULT_PATH, maxsize=128,
+                       **memory_options):
+    """
+    Decorator caching the results of a function in memory (memoize() with
+    maxsize and memory_options) and in the sqlite file at path; use it as
+    @persistent_memoize or @persistent_memoize(path=...).
+    The wrapper has cache_info() and cache_clear() for the memory tier,
+    disk_info() giving (hits, misses, stored results) for the disk tier,
+    and cache_clear(disk=True) empties both.
+    """
+    if function is None:
+        return lambda function: persistent_memoize(function, path, maxsize,
+                                                   **memory_options)
+    store = DiskStore(path)
+    name = "{0}.{1}".format(function.__module__, function.__qualname__)
+    code_hash = code_fingerprint(function)
+    make_key = _make_key_function(function, typed=False)
+    purged = set()
+    stats = {"hits": 0, "misses": 0}
+    stats_lock = threading.Lock()
+
+    def digest(args, kwargs):
+        return hashlib.sha256(_encode((name, code_hash,
+                                       make_key(args, kwargs)))).hexdigest()
+
+    def load_or_compute(*args, **kwargs):
+        if os.getpid() not in purged:
+            store.purge(name, code_hash)
+            purged.add(os.getpid())
+        key = digest(args, kwargs)
+        found, value = store.get(key)
+        with stats_lock:
+            stats["hits" if found else "misses"] += 1
+        if found:
+            return value
+        value = function(*args, **kwargs)
+        store.put(key, name, code_hash, value)
+        return value
+
+    update_wrapper(load_or_compute, function)
+    # The memory tier uses the same digest as its key, so arguments that
+    # can't be hashed (lists, sets, arrays) work too.
+    wrapper = memoize(load_or_compute, maxsize, key=digest, **memory_options)
+    clear_memory = wrapper.cache_clear
+
+    def cache_clear(disk=False):
+        clear_memory()
+        if disk:
+            store.clear(name)
+
+    def disk_info():
+        return stats["hits"], stats["misses"], store.count(name)
+
+    wrapper.cache_clear = cache_clear
+    wrapper.disk_info = disk_info
+    wrapper.store = store
+    return wrapper
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from memoize import memoize
+
+
+def counting(policy, maxsize):
+    calls = []
+
+    @memoize(maxsize=maxsize, policy=policy)
+    def square(x):
+        calls.append(x)
+        return x * x
+    return square, calls
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu", "ttl"])
+def test_new_key_is_kept_after_eviction(policy):
+    square, calls = counting(policy, 3)
+    # Every cached key has been used twice when 4 comes along:
+    for x in [1, 1, 2, 2, 3, 3, 4, 4, 4]:
+        square(x)
+    assert calls == [1, 2, 3, 4]
+    info = square.cache_info()
+    assert info.evictions == 1
+    assert info.currsize == 3
+
+
+def test_lfu_evicts_the_least_used_key():
+    square, calls = counting("lfu", 2)
+    square(1)
+    square(1)
+    square(2)
+    square(3)    # evicts 2, used once
+    square(1)
+    square(3)
+    assert calls == [1, 2, 3]
+    square(2)
+    assert calls == [1, 2, 3, 2]
+
+
+def test_lru_evicts_the_least_recently_used_key():
+    square, calls = counting("lru", 2)
+    for x in [1, 2, 1, 3, 1, 2]:
+        square(x)
+    assert calls == [1, 2, 3, 2]
+
+
+def test_maxsize_zero_caches_nothing():
+    square, calls = counting("lfu", 0)
+    square(1)
+    square(1)
+    assert calls == [1, 1]
+
+
+def test_failing_sizeof_does_not_hang_other_callers():
+    started = threading.Event()
+    release = threading.Event()
+
+    @memoize(sizeof=lambda value: 1 / 0)
+    def slow(x):
+        started.set()
+        release.wait(5)
+        return x
+
+    errors = []
+
+    def call():
+        try:
+            slow(1)
+        except ZeroDivisionError as error:
+            errors.append(error)
+
+    first = threading.Thread(target=call, daemon=True)
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=call, daemon=True)
+    second.start()
+    time.sleep(0.05)    # let the second caller wait on the first
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert not first.is_alive() and not second.is_alive()
+    assert len(errors) == 2
+    # Nothing is left in flight, so a later call computes again.
+    with pytest.raises(ZeroDivisionError):
+        slow(1)
@@ -1,10 +1,11 @@
 # https://www.codecademy.com/courses/analyze-financial-data-with-python-beta/lessons/why-python-finance/exercises/basic-stock-analysis?action=resume_content_item
 
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
-df = pd.read_csv('AAPL_data.csv')
+# Columns mapped from a binary cache of the CSV instead of parsed each run:
+from column_cache import load_frame
+df = load_frame('AAPL_data.csv')
 print(df.head())
 
 df['Daily Log Rate of Return'] = np.log(df['Adj Close']/df['Adj Close'].shift(1))
@@ -14,6 +15,14 @@ print(df['Daily Log Rate of Return'])
 stdev = np.std(df['Daily Log Rate of Return'])
 print(stdev)
 
+# The same statistics, plus rolling windows, kept up to date incrementally:
+# each run only reads the bars appended to the CSV since the last one.
+from rolling_returns import ReturnStats
+stats = ReturnStats.load_or_create('AAPL_data.stats.json', windows=(4, 13, 52))
+stats.update_from_csv('AAPL_data.csv')
+stats.save('AAPL_data.stats.json')
+print(stats)
+
 plt.hist(df['Daily Log Rate of Return'].dropna())
 plt.title('Histogram of AAPL Daily Log Rates of Return')
 plt.xlabel('Log Rate of Return')
@@ -0,0 +1,289 @@
+"""
+Benchmarks with statistics, for when timing_function.py's single
+time.time() measurement isn't enough.
+
+measure() times a function with any arguments: it runs it a few times to
+warm up, works out how many calls (loops) make one repeat long enough for
+the clock to resolve, then times repeat such batches with
+time.perf_counter_ns, with the garbage collector off unless
+gc_enabled=True.
+The Result keeps the time per call of every repeat and reports the median
+and interquartile range, with repeats beyond 1.5 IQR of the quartiles
+flagged as outliers (Tukey's fences).
+
+-->
+>> from benchmark import measure, Suite, compare, save, load
+>> print(measure(sorted, args=(data,), kwargs={"reverse": True}))
+sorted: median 1.21 ms (IQR 1.19 ms .. 1.24 ms), 20 repeats x 8 loops, 1 outlier
+>> suite = Suite()
+>> suite.add("sorted", sorted, data)
+>> results = suite.run()
+>> save(results, "bench.json")
+>> for c in compare(results, load("baseline.json")): print(c)
+-->
+
+Saved results can also be compared from the command line, which exits
+with status 1 if anything got slower:
+
+-->
+$ python benchmark.py compare bench.json baseline.json --threshold 0.05
+-->
+"""
+import argparse
+import datetime
+import gc
+import json
+import platform
+import sys
+import time
+from collections import namedtuple
+from functools import wraps
+
+FORMAT_VERSION = 1
+_UNITS = [(1e9, "s"), (1e6, "ms"), (1e3, "us"), (1, "ns")]
+
+
+def format_ns(ns):
+    """
+    Returns a time in nanoseconds as a string in a readable unit.
+    """
+    for scale, unit in _UNITS:
+        if abs(ns) >= scale or scale == 1:
+            return "{0:.3g} {1}".format(ns / scale, unit)
+
+
+def _quantile(ordered, q):
+    # Linear interpolation between the closest ranks, like numpy's default.
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class Result:
+    """
+    The times of one benchmark: times[i] is the mean time per call, in
+    nanoseconds, over the loops calls of repeat i.
+    """
+    def __init__(self, name, times, loops, warmup=0, metadata=None):
+        self.name = name
+        self.times = list(times)
+        self.loops = loops
+        self.warmup = warmup
+        self.metadata = metadata or {}
+        ordered = sorted(self.times)
+        self.min = ordered[0]
+        self.max = ordered[-1]
+        self.mean = sum(ordered) / len(ordered)
+        self.median = _quantile(ordered, 0.5)
+        self.q1 = _quantile(ordered, 0.25)
+        self.q3 = _quantile(ordered, 0.75)
+        self.iqr = self.q3 - self.q1
+        low = self.q1 - 1.5 * self.iqr
+        high = self.q3 + 1.5 * self.iqr
+        self.outliers = [t for t in self.times if t < low or t > high]
+
+    def to_dict(self):
+        return {"name": self.name, "times": self.times, "loops": self.loops,
+                "warmup": self.warmup, "metadata": self.metadata,
+                "median": self.median, "q1": self.q1, "q3": self.q3}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["times"], data["loops"],
+                   data.get("warmup", 0), data.get("metadata"))
+
+    def __str__(self):
+        outliers = len(self.outliers)
+        return "{0}: median {1} (IQR {2} .. {3}), {4} repeats x {5} loops" \
+            "{6}".format(self.name, format_ns(self.median), format_ns(self.q1),
+                         format_ns(self.q3), len(self.times), self.loops,
+                         ", {0} outlier{1}".format(outliers, "s" * (outliers > 1))
+                         if outliers else "")
+
+
+def _time_loops(function, args, kwargs, loops):
+    # The loop is the only overhead timed along with the calls.
+    counter = time.perf_counter_ns
+    iterations = range(loops)
+    start = counter()
+    for _ in iterations:
+        function(*args, **kwargs)
+    return counter() - start
+
+
+def calibrate(function, args=(), kwargs=None, min_time=0.02, max_loops=1 << 30):
+    """
+    Returns the number of calls, a power of two, that take at least
+    min_time seconds together.
+    """
+    kwargs = kwargs or {}
+    loops = 1
+    while loops < max_loops:
+        if _time_loops(function, args, kwargs, loops) >= min_time * 1e9:
+            break
+        loops *= 2
+    return loops
+
+
+def measure(function, args=(), kwargs=None, repeat=20, warmup=3, loops=None,
+            min_time=0.02, gc_enabled=False, name=None):
+    """
+    Benchmarks function(*args, **kwargs) and returns a Result.
+    loops is the number of calls per repeat, found by calibrate() (with
+    min_time) if not given.
+    The garbage collector is collected before each repeat and kept off
+    during it, unless gc_enabled, which keeps it on while timing even if
+    the caller had turned it off.
+    The collector is left as it was found.
+    """
+    kwargs = kwargs or {}
+    name = name or getattr(function, "__qualname__", repr(function))
+    for _ in range(warmup):
+        function(*args, **kwargs)
+    if loops is None:
+        loops = calibrate(function, args, kwargs, min_time)
+    was_enabled = gc.isenabled()
+    times = []
+    try:
+        if gc_enabled:
+            gc.enable()
+        for _ in range(repeat):
+            if not gc_enabled:
+                gc.collect()
+                gc.disable()
+            times.append(_time_loops(function, args, kwargs, loops) / loops)
+    finally:
+        if was_enabled:
+            gc.enable()
+        else:
+            gc.disable()
+    return Result(name, times, loops, warmup,
+                  {"repeat": repeat, "gc_enabled": gc_enabled})
+
+
+class Suite:
+    """
+    A named set of benchmarks run with the same settings.
+    """
+    def __init__(self, **options):
+        self.options = options
+        self.benchmarks = []
+
+    def add(self, name, function, *args, **kwargs):
+        self.benchmarks.append((name, function, args, kwargs))
+
+    def run(self, names=None, verbose=True):
+        """
+        Returns a dict of name -> Result of the benchmarks (all of them, or
+        those whose names are in names), printing each if verbose.
+        """
+        results = {}
+        for name, function, args, kwargs in self.benchmarks:
+            if names is not None and name not in names:
+                continue
+            results[name] = measure(function, args, kwargs, name=name,
+                                    **self.options)
+            if verbose:
+                print(results[name])
+        return results
+
+
+def save(results, path, metadata=None):
+    """
+    Writes a dict of name -> Result to path as JSON, along with the Python
+    version and platform they were measured on.
+    """
+    data = {"version": FORMAT_VERSION,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version, "platform": platform.platform(),
+            "metadata": metadata or {},
+            "results": {name: r.to_dict() for name, r in results.items()}}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1)
+
+
+def load(path):
+    """
+    Returns the dict of name -> Result saved at path.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError("{0} isn't a benchmark results file".format(path))
+    return {name: Result.from_dict(r) for name, r in data["results"].items()}
+
+
+class Comparison(namedtuple("Comparison", "name baseline current ratio status")):
+    """
+    How one benchmark's median changed against the baseline: ratio is
+    current / baseline, and status is "slower", "faster" or "same".
+    """
+    def __str__(self):
+        if self.baseline is None or self.current is None:
+            return "{0}: {1}".format(self.name, self.status)
+        return "{0}: {1} -> {2} ({3:+.1%}) {4}".format(
+            self.name, format_ns(self.baseline.median),
+            format_ns(self.current.median), self.ratio - 1, self.status)
+
+
+def compare(results, baseline, threshold=0.05):
+    """
+    Compares two dicts of name -> Result and returns a Comparison for every
+    name in either.
+    A benchmark only counts as slower (or faster) if its median moved by
+    more than threshold and its interquartile range no longer overlaps the
+    baseline's, so noise alone doesn't flag it.
+    """
+    comparisons = []
+    for name in list(results) + [n for n in baseline if n not in results]:
+        current, before = results.get(name), baseline.get(name)
+        if current is None or before is None:
+            status = "only in baseline" if current is None else "new"
+            comparisons.append(Comparison(name, before, current, None, status))
+            continue
+        ratio = current.median / before.median
+        if ratio > 1 + threshold and current.q1 > before.q3:
+            status = "slower"
+        elif ratio < 1 - threshold and current.q3 < before.q1:
+            status = "faster"
+        else:
+            status = "same"
+        comparisons.append(Comparison(name, before, current, ratio, status))
+    return comparisons
+
+
+def regressions(comparisons):
+    return [c for c in comparisons if c.status == "slower"]
+
+
+def timed(function):
+    """
+    Decorator like timing_function.timing_function, but keeping the
+    function's arguments and return value: each call's time, in
+    nanoseconds, is stored in the wrapper's last_ns.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            wrapper.last_ns = time.perf_counter_ns() - start
+    wrapper.last_ns = None
+    return wrapper
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare benchmark results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--threshold", type=float, default=0.05)
+    args = parser.parse_args()
+    comparisons = compare(load(args.results), load(args.baseline),
+                          args.threshold)
+    for comparison in comparisons:
+        print(comparison)
+    sys.exit(1 if regressions(comparisons) else 0)
@@ -0,0 +1,395 @@
+"""
+The benchmark suite: the project's hot paths timed with benchmark.measure
+over a range of input sizes.
+
+Each case is set up for every size n and timed, and its peak memory for one
+call is taken with tracemalloc. The report gives, for every case, the
+median time and peak memory per n and the slope of log(time) against
+log(n), so ~n^1.0 is linear and ~n^2.0 quadratic.
+
+-->
+$ python benchmarks.py
+$ python benchmarks.py --only npv csv --save bench.json --plot scaling.png
+$ python benchmarks.py --revisions HEAD~5 HEAD
+-->
+
+--revisions checks the two revisions out into temporary git worktrees,
+runs this suite (as it is now) against the code of each, and compares
+them as benchmark.compare does, exiting with status 1 on a regression.
+Cases that an older revision's code can't run are skipped there.
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import benchmark
+
+# Some of the older scripts plot when imported.
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The directories the scripts import their neighbors from.
+SOURCE_DIRS = ("", "exercises", "lets_play_cards", "advanced_python_features")
+
+CASES = []
+
+
+def case(name, sizes):
+    """
+    Decorator registering setup(n) as the case name, run for each n in
+    sizes. setup(n) returns the zero-argument function to be timed.
+    """
+    def register(setup):
+        CASES.append((name, tuple(sizes), setup))
+        return setup
+    return register
+
+
+def use_source(root):
+    """
+    Makes the modules under root, rather than next to this file, the ones
+    that the cases import.
+    """
+    paths = [os.path.join(root, d) for d in SOURCE_DIRS]
+    own = {os.path.abspath(os.path.join(HERE, d)) for d in SOURCE_DIRS}
+    sys.path[:] = paths + [p for p in sys.path
+                           if os.path.abspath(p or os.curdir) not in own]
+
+
+def quiet_import(name):
+    # Several modules print or plot as they are imported.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return __import__(name)
+
+
+@case("mt19937.extract_number", sizes=(1000, 10000, 100000))
+def mt19937_extract_number(n):
+    generator = quiet_import("mersenne_twister").MT19937(5489)
+
+    def run():
+        extract = generator.extract_number
+        for _ in range(n):
+            extract()
+    return run
+
+
+def seed_cards(cards, seed):
+    # Decks shuffle with the module's own generator, where cards.py has one,
+    # and with the random module's otherwise (as the baseline does).
+    getattr(cards, "_shuffler", random).seed(seed)
+
+
+@case("deck.shuffle_deal", sizes=(2, 4, 8, 13, 26))
+def deck_shuffle_deal(n):
+    cards = quiet_import("cards")
+    seed_cards(cards, n)
+
+    def run():
+        deck = cards.Deck()
+        deck.shuffle()
+        deck.deal([cards.Hand(str(i)) for i in range(n)])
+    return run
+
+
+@case("oldmaid.play", sizes=(2, 4, 8, 16))
+def oldmaid_play(n):
+    cards = quiet_import("cards")
+    names = ["player {0}".format(i) for i in range(n)]
+    seed_cards(cards, n)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards.OldMaidGame().play(names)
+    return run
+
+
+@case("npv.calculate_npv", sizes=(10, 100, 1000, 10000))
+def npv_calculate_npv(n):
+    calculate_npv = quiet_import("net_present_value").calculate_npv
+    rng = random.Random(n)
+    cash_flow = [-1e6] + [rng.uniform(0, 2e3) for _ in range(n - 1)]
+    # A daily rate: (1 + rate) ** t stays finite over every size, where an
+    # annual 8% overflows a float by t = 10000.
+    return lambda: calculate_npv(0.08 / 365, cash_flow)
+
+
+_scratch = None
+
+
+def price_csv(n):
+    """
+    Writes n weekly bars of made-up prices in AAPL_data.csv's layout to a
+    temporary file and returns its path.
+    """
+    global _scratch
+    if _scratch is None:
+        _scratch = tempfile.TemporaryDirectory(prefix="bench-")
+    rng = random.Random(n)
+    path = os.path.join(_scratch.name, "prices{0}.csv".format(n))
+    price = 100.0
+    with open(path, "w") as f:
+        f.write("Date,Open,High,Low,Close,Adj Close,Volume\n")
+        for i in range(n):
+            price *= math.exp(rng.gauss(0, 0.03))
+            f.write("2000-01-{0:02d},{1:f},{2:f},{3:f},{1:f},{1:f},{4}\n"
+                    .format(i % 28 + 1, price, price * 1.01, price * 0.99,
+                            rng.randrange(10 ** 8, 10 ** 9)))
+    return path
+
+
+@case("csv.basic_analysis", sizes=(1000, 10000, 100000))
+def csv_basic_analysis(n):
+    # What basic_analysis.py did before column_cache: parse the whole
+    # file, then take the log returns and their standard deviation.
+    import numpy as np
+    import pandas as pd
+    path = price_csv(n)
+
+    def run():
+        df = pd.read_csv(path)
+        returns = np.log(df["Adj Close"] / df["Adj Close"].shift(1))
+        return np.std(returns)
+    return run
+
+
+@case("csv.load_frame", sizes=(1000, 10000, 100000))
+def csv_load_frame(n):
+    load_frame = quiet_import("column_cache").load_frame
+    path = price_csv(n)
+    load_frame(path)    # builds the cache; the timed loads map it
+    return lambda: load_frame(path)
+
+
+@case("csv.rolling_returns", sizes=(1000, 10000, 100000))
+def csv_rolling_returns(n):
+    ReturnStats = quiet_import("rolling_returns").ReturnStats
+    path = price_csv(n)
+    return lambda: ReturnStats(windows=(4, 13, 52)).update_from_csv(path)
+
+
+@case("cache.hits", sizes=(100, 1000, 10000))
+def cache_hits(n):
+    cached = quiet_import("decorators").cache(abs)
+    for i in range(n):
+        cached(i)
+
+    def run():
+        for i in range(n):
+            cached(i)
+    return run
+
+
+@case("memoize.hits", sizes=(100, 1000, 10000))
+def memoize_hits(n):
+    memoized = quiet_import("memoize").memoize(maxsize=n)(abs)
+    for i in range(n):
+        memoized(i)
+
+    def run():
+        for i in range(n):
+            memoized(i)
+    return run
+
+
+def peak_memory(function):
+    """
+    Returns the most memory, in bytes, that one call of function allocated
+    at once.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return "{0:.3g} {1}".format(size, unit)
+        size /= 1024
+    return "{0:.3g} GiB".format(size)
+
+
+def scaling_exponent(sizes, medians):
+    """
+    Returns the least-squares slope of log(median) against log(n).
+    """
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(m) for m in medians]
+    x_mean, y_mean = sum(xs) / len(xs), sum(ys) / len(ys)
+    sxx = sum((x - x_mean) ** 2 for x in xs)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sxx
+
+
+def run_suite(only=None, root=HERE, verbose=True, **options):
+    """
+    Runs every case (or those whose names start with one of the prefixes in
+    only) at every size against the code under root, and returns a dict of
+    "name[n]" -> benchmark.Result with n and peak_bytes in each result's
+    metadata.
+    """
+    use_source(os.path.abspath(root))
+    options.setdefault("repeat", 10)
+    options.setdefault("min_time", 0.01)
+    results = {}
+    for name, sizes, setup in CASES:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        for n in sizes:
+            key = "{0}[{1}]".format(name, n)
+            try:
+                function = setup(n)
+            except (ImportError, AttributeError) as error:
+                # The code under root doesn't have this case at all.
+                if verbose:
+                    print("{0}: skipped ({1})".format(name, error))
+                break
+            except Exception as error:
+                if verbose:
+                    print("{0}: failed in setup ({1!r})".format(key, error))
+                continue
+            # One failing size is reported and skipped, not allowed to stop
+            # the rest of the suite.
+            try:
+                peak = peak_memory(function)
+                result = benchmark.measure(function, name=key, **options)
+            except Exception as error:
+                if verbose:
+                    print("{0}: failed ({1!r})".format(key, error))
+                continue
+            result.metadata.update(case=name, n=n, peak_bytes=peak)
+            results[key] = result
+            if verbose:
+                print("{0}, peak {1}".format(result, format_bytes(peak)))
+    return results
+
+
+def curves(results):
+    """
+    Returns {case: [(n, Result), ...]} sorted by n.
+    """
+    by_case = {}
+    for result in results.values():
+        by_case.setdefault(result.metadata["case"], []).append(
+            (result.metadata["n"], result))
+    return {name: sorted(points, key=lambda p: p[0])
+            for name, points in by_case.items()}
+
+
+def report(results):
+    lines = []
+    for name, points in curves(results).items():
+        line = name
+        if len(points) > 1:
+            line += " ~ n^{0:.2f}".format(scaling_exponent(
+                [n for n, _ in points], [r.median for _, r in points]))
+        lines.append(line)
+        for n, r in points:
+            lines.append("  {0:>8}  {1:>9}  IQR {2:>9}  peak {3:>9}".format(
+                n, benchmark.format_ns(r.median), benchmark.format_ns(r.iqr),
+                format_bytes(r.metadata["peak_bytes"])))
+    return "\n".join(lines)
+
+
+def plot(results, path):
+    """
+    Saves the scaling curves of results, time per call against n on
+    log-log axes, to an image at path.
+    """
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots(figsize=(8, 6))
+    for name, points in curves(results).items():
+        axes.loglog([n for n, _ in points], [r.median for _, r in points],
+                    marker="o", label=name)
+    axes.set_xlabel("n")
+    axes.set_ylabel("median time per call (ns)")
+    axes.legend(fontsize="small")
+    figure.savefig(path)
+    plt.close(figure)
+
+
+def run_revision(revision, workdir, arguments):
+    """
+    Runs this suite against the code of a git revision, checked out in a
+    temporary worktree under workdir, and returns its results.
+    """
+    tree = os.path.join(workdir, "tree")
+    output = os.path.join(workdir, "results.json")
+    subprocess.run(["git", "worktree", "add", "--detach", tree, revision],
+                   cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+    try:
+        print("== {0}".format(revision))
+        subprocess.run([sys.executable, os.path.abspath(__file__),
+                        "--root", tree, "--save", output] + arguments,
+                       check=True)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", tree],
+                       cwd=HERE, check=True)
+    return benchmark.load(output)
+
+
+def compare_revisions(baseline, revision, arguments, threshold=0.05):
+    """
+    Runs the suite at both revisions, prints how each benchmark changed
+    from baseline to revision and returns the comparisons.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        before = run_revision(baseline, os.path.join(workdir, "a"), arguments)
+        after = run_revision(revision, os.path.join(workdir, "b"), arguments)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("== {0} -> {1}".format(baseline, revision))
+    comparisons = benchmark.compare(after, before, threshold)
+    for c in comparisons:
+        line = str(c)
+        if c.baseline is not None and c.current is not None:
+            line += ", peak {0} -> {1}".format(
+                format_bytes(c.baseline.metadata["peak_bytes"]),
+                format_bytes(c.current.metadata["peak_bytes"]))
+        print(line)
+    return comparisons
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX",
+                        help="run only the cases starting with these")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--min-time", type=float, default=0.01)
+    parser.add_argument("--save", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--plot", metavar="PATH",
+                        help="save the scaling curves as an image")
+    parser.add_argument("--revisions", nargs=2, metavar=("BASELINE", "REV"),
+                        help="compare two git revisions instead")
+    parser.add_argument("--threshold", type=float, default=0.05)
+    parser.add_argument("--root", default=HERE, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.revisions:
+        passed = ["--repeat", str(args.repeat), "--min-time", str(args.min_time)]
+        if args.only:
+            passed += ["--only"] + args.only
+        comparisons = compare_revisions(*args.revisions, passed,
+                                        threshold=args.threshold)
+        sys.exit(1 if benchmark.regressions(comparisons) else 0)
+
+    results = run_suite(args.only, args.root, repeat=args.repeat, min_time=args.min_time)
+    print()
+    print(report(results))
+    if args.save:
+        benchmark.save(results, args.save,
+                       {"root": os.path.abspath(args.root)})
+    if args.plot:
+        plot(results, args.plot)
@@ -1,21 +1,31 @@
 # https://www.codecademy.com/courses/analyze-financial-data-with-python-beta/lessons/why-python-finance/exercises/python-candlestick-chart?action=resume_content_item
 
-import datetime
-import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from mpl_finance import candlestick_ohlc
+from ohlc import resample, candlestick_rows, OHLCPyramid, draw_candlesticks
 
-df = pd.read_csv('AAPL_data.csv')
+# Columns mapped from a binary cache of the CSV instead of parsed each run:
+from column_cache import load_frame
+df = load_frame('AAPL_data.csv')
 print(df.head())
 
-df['Date'] = pd.to_datetime(df['Date'])
-df["Date"] = df["Date"].apply(mdates.date2num)
-candle_data = df[['Date', 'Open', 'High', 'Low', 'Close']]
-print(candle_data.head())
+# Plot one candle per period: None keeps the weekly bars of the file, or
+# use 'M', 'Q', 'Y' (or '2W', '6M' ...) for fewer, wider candles.
+period = None
+bars = df if period is None else resample(df, period)
+# Dates are converted for the whole column at once, not one row at a time:
+candle_data = candlestick_rows(bars)
+print(candle_data[:5])
+# Longer periods get candles as much wider as their bars are further apart:
+width = 0.2 if period is None else 0.2 * np.diff(candle_data[:, 0]).min() / 7
 
 f1, ax = plt.subplots(figsize = (10,5))
-candlestick_ohlc(ax,candle_data.values, colorup='green',colordown='red')
+# Only as many candles as the axes have room for are drawn, merging
+# neighbouring bars when zoomed out, and they are redrawn on zoom and pan:
+draw_candlesticks(ax, OHLCPyramid(candle_data), width=width, draw=candlestick_ohlc,
+                  colorup='green', colordown='red')
 ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
 plt.title('Candlestick Chart for AAPL')
 plt.xlabel('Date')
@@ -0,0 +1,171 @@
+"""
+A binary, memory-mapped column cache for the CSV files the analysis scripts
+read (AAPL_data.csv, quarters.csv ...).
+
+The first time a CSV is loaded its columns are parsed once into typed NumPy
+arrays and written next to it as <name>.csv.columns.
+Later loads map that file instead of parsing text, so every column is a
+read-only, zero-copy view of the cache file.
+The cache is rebuilt when the CSV's size and modification time no longer
+match what was recorded and its SHA-256 hash doesn't either.
+
+-->
+>> from column_cache import load_columns, load_frame
+>> columns = load_columns('AAPL_data.csv')
+>> columns['Adj Close'][:3]
+memmap([93.51429 , 94.556244, 91.683792])
+>> df = load_frame('AAPL_data.csv')    # a pandas DataFrame over the same views
+-->
+
+File layout: an 8-byte magic string, an 8-byte little-endian header length,
+a JSON header describing the source file and the columns, and then the data
+of each column, every one starting on a 64-byte boundary.
+"""
+import csv
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"CSVCOL1\0"
+ALIGNMENT = 64
+
+
+def cache_path(path):
+    return path + ".columns"
+
+
+def _source_info(path, digest=True):
+    stat = os.stat(path)
+    info = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if digest:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        info["sha256"] = sha.hexdigest()
+    return info
+
+
+def _parse_column(values):
+    """
+    Returns values (a list of strings) as the narrowest array that holds
+    them: int64, float64 (empty cells become nan), datetime64[s] for dates,
+    or else unicode strings.
+    """
+    try:
+        return np.array([int(v) for v in values], dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array([float(v) if v else np.nan for v in values])
+    except ValueError:
+        pass
+    try:
+        return np.array(values, dtype="datetime64[s]")
+    except ValueError:
+        return np.array(values, dtype=str)
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        names = next(reader)
+        rows = [row for row in reader if row]
+    columns = {}
+    for i, name in enumerate(names):
+        columns[name] = _parse_column([row[i] for row in rows])
+    return columns
+
+
+def _write_cache(path, columns, source):
+    header = {"source": source, "rows": 0, "columns": []}
+    offset = 0
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+        header["rows"] = len(values)
+        header["columns"].append({"name": name, "dtype": values.dtype.str,
+                                  "offset": offset, "count": len(values)})
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    text = json.dumps(header).encode()
+    # Pad the header so that the data starts on a boundary too:
+    start = -(-(16 + len(text)) // ALIGNMENT) * ALIGNMENT
+    text += b" " * (start - 16 - len(text))
+
+    temporary = "{0}.{1}.tmp".format(cache_path(path), os.getpid())
+    with open(temporary, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(text)) + text)
+        for values, column in zip(columns.values(), header["columns"]):
+            f.seek(start + column["offset"])
+            f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate(start + offset)
+    # Readers never see a half-written cache:
+    os.replace(temporary, cache_path(path))
+
+
+def _read_header(cached):
+    with open(cached, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError("not a column cache")
+        (length,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(length)), 16 + length
+
+
+def _map_columns(cached, header, start, mode="r"):
+    columns = {}
+    for column in header["columns"]:
+        if column["count"]:
+            columns[column["name"]] = np.memmap(
+                cached, dtype=np.dtype(column["dtype"]), mode=mode,
+                offset=start + column["offset"], shape=(column["count"],))
+        else:
+            columns[column["name"]] = np.empty(0, np.dtype(column["dtype"]))
+    return columns
+
+
+def load_columns(path, writable=False):
+    """
+    Returns a dict of column name -> read-only array for the CSV at path,
+    mapped from its column cache (built first if missing or stale).
+    With writable, the arrays are mapped copy-on-write instead: they can be
+    changed in place, and the pages written to are copied in memory, so the
+    cache file itself never changes.
+    """
+    mode = "c" if writable else "r"
+    cached = cache_path(path)
+    try:
+        header, start = _read_header(cached)
+    except (OSError, ValueError):
+        header = None
+    if header is not None:
+        recorded = header["source"]
+        current = _source_info(path, digest=False)
+        if current["size"] == recorded["size"] \
+                and current["mtime_ns"] == recorded["mtime_ns"]:
+            return _map_columns(cached, header, start, mode)
+        current = _source_info(path)
+        if current["sha256"] == recorded["sha256"]:
+            # Only the timestamp changed: record the new one so that the
+            # next load doesn't hash the file again.
+            columns = _map_columns(cached, header, start)
+            _write_cache(path, {name: np.array(values)
+                                for name, values in columns.items()}, current)
+            return _map_columns(cached, *_read_header(cached), mode)
+    source = _source_info(path)
+    _write_cache(path, _read_csv(path), source)
+    return _map_columns(cached, *_read_header(cached), mode)
+
+
+def load_frame(path, writable=False):
+    """
+    Returns the CSV at path as a pandas DataFrame whose columns are views
+    of the column cache rather than copies.
+    The views are read-only, so changing the frame in place (df.loc[...] =
+    ..., df[col] += ...) raises ValueError unless writable is set, which
+    maps the columns copy-on-write (see load_columns()).
+    Adding or replacing whole columns works either way.
+    """
+    import pandas as pd
+    return pd.DataFrame(load_columns(path, writable), copy=False)
@@ -1,11 +1,12 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-from rf import return_portfolios, optimal_portfolio
+from frontier import optimal_portfolio
+from portfolios import return_portfolios
 import codecademylib3_seaborn
 import numpy as np
+from column_cache import load_frame
 
 path='quarters.csv'
-stock_data = pd.read_csv(path)
+stock_data = load_frame(path)
 print(stock_data.head())
 selected=list(stock_data.columns[1:])
 
@@ -1,27 +1,193 @@
 ## https://en.wikipedia.org/wiki/Mersenne_Twister#Python_implementation
 ## This Python implementation hard-codes the constants for MT19937.
+import math
+
+import numpy as np
+
+_N = 624
+_M = 397
+_MATRIX_A = np.uint32(0x9908b0df)
+_UPPER_MASK = np.uint32(0x80000000)
+_LOWER_MASK = np.uint32(0x7fffffff)
+
+# The twist can't be done as one whole-array operation, because element i
+# reads element (i + 397) % 624, which has already been replaced when
+# i >= 227.
+# Splitting the state into blocks of at most 227 elements makes every block
+# depend only on values that are either untouched or finished in an earlier
+# block, so each block is a single vectorized step.
+_TWIST_BLOCKS = []
+for _lo, _hi in ((0, _N - _M), (_N - _M, 2 * (_N - _M)),
+                 (2 * (_N - _M), _N - 1), (_N - 1, _N)):
+    _i = np.arange(_lo, _hi)
+    _TWIST_BLOCKS.append((_lo, _hi, (_i + 1) % _N, (_i + _M) % _N))
+
+
+# The characteristic polynomial of the MT19937 state transition and the
+# polynomials x**(2**k) mod it are expensive to find, so they are computed on
+# first use and kept for the life of the process.
+_CHAR_POLY = None
+_JUMP_POLYS = {}
+
+# Squaring a polynomial over GF(2) just spreads its bits apart, so each byte
+# maps to the two-byte value with a zero between every bit.
+_SPREAD_BYTES = [
+    sum(((b >> k) & 1) << (2 * k) for k in range(8)).to_bytes(2, "little")
+    for b in range(256)]
+
 
 def _int32(x):
     # Get the 32 least significant bits:
     return int(0xFFFFFFFF & x)
 
+
+def _twist_array(mt):
+    """
+    Regenerates the 624 words of mt (a uint32 NumPy array) in place.
+    """
+    for lo, hi, nxt, far in _TWIST_BLOCKS:
+        y = (mt[lo:hi] & _UPPER_MASK) | (mt[nxt] & _LOWER_MASK)
+        mt[lo:hi] = mt[far] ^ (y >> 1) ^ ((y & 1) * _MATRIX_A)
+
+
+def _temper_array(y):
+    """
+    Applies the MT19937 tempering transform to the uint32 array y in place.
+    """
+    y ^= y >> 11
+    y ^= (y << 7) & np.uint32(2636928640)
+    y ^= (y << 15) & np.uint32(4022730752)
+    y ^= y >> 18
+
+
+def _berlekamp_massey(bits):
+    """
+    Returns the characteristic polynomial (bit i is the coefficient of x**i)
+    of the shortest linear recurrence over GF(2) that generates bits.
+    """
+    connection = previous = 1
+    length, shift = 0, 1
+    window = 0  # bit i holds bits[n - i]
+    for n, bit in enumerate(bits):
+        window = (window << 1) | bit
+        if (connection & window).bit_count() & 1:
+            old = connection
+            connection ^= previous << shift
+            if 2 * length <= n:
+                length = n + 1 - length
+                previous = old
+                shift = 1
+                continue
+        shift += 1
+    # The connection polynomial is the characteristic polynomial with its
+    # coefficients reversed:
+    return int(format(connection, "0%db" % (length + 1))[::-1], 2)
+
+
+def _characteristic_polynomial():
+    global _CHAR_POLY
+    if _CHAR_POLY is None:
+        # Every bit of the raw (untempered) words satisfies the recurrence of
+        # the 19937-bit state, so Berlekamp-Massey on twice that many bits
+        # recovers its characteristic polynomial.
+        mt = MT19937(5489).mt
+        bits = []
+        while len(bits) < 2 * 19937:
+            _twist_array(mt)
+            bits.extend((mt >> 31).tolist())
+        _CHAR_POLY = _berlekamp_massey(bits[:2 * 19937])
+    return _CHAR_POLY
+
+
+def _jump_polynomial(k):
+    """
+    Returns x**(2**k) mod the characteristic polynomial.
+    """
+    if k not in _JUMP_POLYS:
+        poly = _characteristic_polynomial()
+        degree = poly.bit_length() - 1
+        # reduce[b] is (b(x) * x**degree) mod poly, which lets the reduction
+        # below clear eight bits per step instead of one.
+        reduce = [0] * 256
+        low = poly ^ (1 << degree)
+        for i in range(8):
+            reduce[1 << i] = low
+            low <<= 1
+            if low >> degree:
+                low ^= poly
+        for b in range(1, 256):
+            if b & (b - 1):
+                reduce[b] = reduce[b & (b - 1)] ^ reduce[b & -b]
+
+        result = 2  # x
+        for _ in range(k):
+            data = result.to_bytes((result.bit_length() + 7) // 8, "little")
+            result = int.from_bytes(
+                b"".join([_SPREAD_BYTES[b] for b in data]), "little")
+            while result.bit_length() > degree:
+                shift = max(result.bit_length() - degree - 8, 0)
+                top = result >> (degree + shift)
+                result ^= (top << (degree + shift)) ^ (reduce[top] << shift)
+        _JUMP_POLYS[k] = result
+    return _JUMP_POLYS[k]
+
+
+def _ziggurat_tables(r, area, density, inverse, scale):
+    """
+    Builds the 256-layer ziggurat tables for a decreasing density with tail
+    start r and layer area, following Marsaglia and Tsang (2000).
+    Returns (k, w, f): a candidate u * w[i] from layer i is accepted at once
+    when u < k[i], and f[i] is the density at the edge of layer i.
+    """
+    k = np.zeros(256, dtype=np.uint64)
+    w = np.zeros(256)
+    f = np.zeros(256)
+    q = area / density(r)
+    k[0] = int(r / q * scale)
+    w[0] = q / scale
+    w[255] = r / scale
+    f[0] = 1.0
+    f[255] = density(r)
+    x = outer = r
+    for i in range(254, 0, -1):
+        x = inverse(area / x + density(x))
+        k[i + 1] = int(x / outer * scale)
+        outer = x
+        f[i] = density(x)
+        w[i] = x / scale
+    return k, w, f
+
+
+_NORMAL_R = 3.6541528853610088
+_NORMAL_KI, _NORMAL_WI, _NORMAL_FI = _ziggurat_tables(
+    _NORMAL_R, 0.00492867323399, lambda x: math.exp(-0.5 * x * x),
+    lambda y: math.sqrt(-2.0 * math.log(y)), 2.0 ** 52)
+_EXP_R = 7.69711747013104972
+_EXP_KE, _EXP_WE, _EXP_FE = _ziggurat_tables(
+    _EXP_R, 0.0039496598225815571993, lambda x: math.exp(-x),
+    lambda y: -math.log(y), 2.0 ** 53)
+
+
 class MT19937:
 
     def __init__(self, seed):
         # Initialize the index to 0:
         self.index = 624
-        self.mt = [0] * 624
-        # Initialize the initial state to the seed:
-        self.mt[0] = seed
+        mt = [0] * 624
+        # Initialize the initial state to the seed (its low 32 bits, as the
+        # reference init_genrand() does):
+        mt[0] = _int32(seed)
         for i in range(1, 624):
-            self.mt[i] = _int32(
-                1812433253 * (self.mt[i - 1] ^ self.mt[i - 1] >> 30) + i)
+            mt[i] = _int32(1812433253 * (mt[i - 1] ^ mt[i - 1] >> 30) + i)
+        # The state lives in a uint32 array so that twist() and the bulk
+        # methods below can work on all 624 words at once.
+        self.mt = np.array(mt, dtype=np.uint32)
 
     def extract_number(self):
         if self.index >= 624:
             self.twist()
 
-        y = self.mt[self.index]
+        y = int(self.mt[self.index])
 
         # Right shift by 11 bits:
         y = y ^ y >> 11
@@ -37,14 +203,352 @@ class MT19937:
         return _int32(y)
 
     def twist(self):
-        for i in range(624):
-            # Get the most significant bit and add it to the less
-            # significant bits of the next number.
-            y = _int32((self.mt[i] & 0x80000000) +
-                       (self.mt[(i + 1) % 624] & 0x7fffffff))
-            self.mt[i] = self.mt[(i + 397) % 624] ^ y >> 1
-
-            if y % 2 != 0:
-                self.mt[i] = self.mt[i] ^ 0x9908b0df
+        # Get the most significant bit of each word and add it to the less
+        # significant bits of the next one, a block of words at a time.
+        _twist_array(self.mt)
         self.index = 0
-        #test
+
+    def fill(self, buffer):
+        """
+        Fills buffer with the next len(buffer) 32-bit outputs and returns it.
+        buffer can be anything that np.asarray() turns into a writable,
+        one-dimensional uint32 array without copying (a NumPy array, an
+        array('I') on platforms where that is 32 bits, a memoryview ...).
+        The values written are exactly the ones that the same number of
+        extract_number() calls would have returned, and the two can be mixed
+        freely.
+        """
+        out = np.asarray(buffer)
+        if out.dtype != np.uint32 or out.ndim != 1:
+            raise TypeError("fill() needs a one-dimensional uint32 buffer")
+        if not out.flags.writeable:
+            raise ValueError("fill() needs a writable buffer")
+        size = out.shape[0]
+        pos = 0
+        while pos < size:
+            if self.index >= 624:
+                self.twist()
+            count = min(624 - self.index, size - pos)
+            chunk = out[pos:pos + count]
+            chunk[...] = self.mt[self.index:self.index + count]
+            _temper_array(chunk)
+            self.index += count
+            pos += count
+        return buffer
+
+    def random_raw(self, size=None):
+        """
+        Returns the next 32-bit output as an int when size is None, or a new
+        uint32 array of the next size outputs otherwise.
+        """
+        if size is None:
+            return self.extract_number()
+        return self.fill(np.empty(size, dtype=np.uint32).reshape(-1)) \
+            .reshape(size)
+
+    def jump(self, k):
+        """
+        Advances the generator by 2**k outputs in place, as if
+        extract_number() had been called 2**k times.
+        The jump evaluates x**(2**k) mod the characteristic polynomial of the
+        generator at its state, so it costs about the same for any k.
+        """
+        poly = _jump_polynomial(k)
+        # Words x[t], x[t + 1], ... where tempering x[t] gives the next output:
+        block = self.mt.copy()
+        if self.index >= 624:
+            _twist_array(block)
+            words = [block.copy()]
+        else:
+            following = block.copy()
+            _twist_array(following)
+            words = [np.concatenate((block[self.index:],
+                                     following[:self.index]))]
+            block = words[0].copy()
+        while len(words) * 624 < 19937 + 624:
+            _twist_array(block)
+            words.append(block.copy())
+        words = np.concatenate(words)
+
+        # Since x**(2**k) = sum(c[i] * x**i) modulo the characteristic
+        # polynomial, x[t + 2**k + j] is the XOR of x[t + i + j] over the
+        # nonzero coefficients c[i].
+        data = poly.to_bytes((poly.bit_length() + 7) // 8, "little")
+        terms = np.flatnonzero(np.unpackbits(
+            np.frombuffer(data, dtype=np.uint8), bitorder="little"))
+        offsets = np.arange(624)
+        state = np.zeros(624, dtype=np.uint32)
+        for start in range(0, len(terms), 1024):
+            chunk = terms[start:start + 1024]
+            state ^= np.bitwise_xor.reduce(
+                words[chunk[:, None] + offsets], axis=0)
+
+        # That holds for every bit except the low 31 bits of the first word,
+        # which never feed back into the state.
+        # They can be recovered from the last word, which was built from them:
+        v = int(state[623] ^ state[396])
+        if v & 0x80000000:
+            y = ((v ^ 0x9908b0df) << 1) | 1
+        else:
+            y = v << 1
+        state[0] = (int(state[0]) & 0x80000000) | (y & 0x7fffffff)
+
+        self.mt = state
+        self.index = 0
+
+    def spawn(self, n, k=128):
+        """
+        Returns a list of n generators for n workers.
+        Generator i starts i * 2**k outputs after this one, so each worker
+        owns a stream of 2**k outputs that overlaps no other, and the first
+        2**k outputs of each, taken in order, are exactly what this generator
+        would have produced on its own.
+        This generator is then advanced past all of them.
+        """
+        children = []
+        for _ in range(n):
+            child = type(self).__new__(type(self))
+            child.mt = self.mt.copy()
+            child.index = self.index
+            children.append(child)
+            self.jump(k)
+        return children
+
+    ############################  SAMPLERS  ##################################
+    # Every sampler below takes size=None for a single Python value, or a
+    # size (or an existing array as out) for a NumPy array filled from one
+    # bulk draw of raw words.
+
+    def _output(self, size, out, dtype):
+        if out is None:
+            out = np.empty(size, dtype=dtype)
+        elif out.dtype != dtype:
+            raise TypeError("out must be a %s array" % np.dtype(dtype).name)
+        return out
+
+    def _next_uint64(self, size=None):
+        if size is None:
+            return (self.extract_number() << 32) | self.extract_number()
+        words = self.random_raw(2 * size).astype(np.uint64).reshape(size, 2)
+        return (words[:, 0] << np.uint64(32)) | words[:, 1]
+
+    def _bounded(self, spans):
+        """
+        Returns an array of uniform integers in [0, spans[i]) for a uint64
+        array of spans, using Lemire's multiply-shift method with rejection
+        so that there is no modulo bias.
+        Spans larger than 2**32 don't fit the 32-bit method; they take a
+        64-bit draw each instead (see _bounded_wide()).
+        """
+        wide = spans > np.uint64(2 ** 32)
+        if wide.any():
+            result = np.empty(len(spans), dtype=np.uint64)
+            result[wide] = self._bounded_wide(spans[wide])
+            result[~wide] = self._bounded(spans[~wide])
+            return result
+        products = self.random_raw(len(spans)).astype(np.uint64) * spans
+        thresholds = (np.uint64(2 ** 32) - spans) % spans
+        retry = np.flatnonzero((products & np.uint64(0xFFFFFFFF)) < thresholds)
+        while len(retry):
+            products[retry] = (self.random_raw(len(retry))
+                               .astype(np.uint64) * spans[retry])
+            low = products[retry] & np.uint64(0xFFFFFFFF)
+            retry = retry[low < thresholds[retry]]
+        return products >> np.uint64(32)
+
+    def _bounded_wide(self, spans):
+        # 64-bit draws x taken modulo each span, rejecting the x below
+        # 2**64 % span so that every remainder is equally likely.
+        with np.errstate(over="ignore"):
+            thresholds = (np.uint64(0) - spans) % spans
+        draws = self._next_uint64(len(spans))
+        retry = np.flatnonzero(draws < thresholds)
+        while len(retry):
+            draws[retry] = self._next_uint64(len(retry))
+            retry = retry[draws[retry] < thresholds[retry]]
+        return draws % spans
+
+    def random(self, size=None, out=None):
+        """
+        Returns uniform doubles in [0, 1) with 53-bit resolution, built from
+        two 32-bit outputs each exactly like genrand_res53() in the reference
+        C code, so the scalar and bulk forms give the same values.
+        """
+        if size is None and out is None:
+            a = self.extract_number() >> 5
+            b = self.extract_number() >> 6
+            return (a * 67108864.0 + b) * (1.0 / 9007199254740992.0)
+        out = self._output(size, out, np.float64)
+        words = self.random_raw(2 * out.size).reshape(out.size, 2)
+        flat = out.reshape(-1)
+        np.multiply(words[:, 0] >> 5, 67108864.0, out=flat)
+        flat += words[:, 1] >> 6
+        flat *= 1.0 / 9007199254740992.0
+        return out
+
+    def integers(self, low, high=None, size=None, out=None):
+        """
+        Returns uniform integers in [low, high), or [0, low) when high is
+        left out.
+        The range may hold at most 2**32 values.
+        """
+        if high is None:
+            low, high = 0, low
+        span = high - low
+        if not 0 < span <= 2 ** 32:
+            raise ValueError("integers() needs 0 < high - low <= 2**32")
+        if size is None and out is None:
+            product = self.extract_number() * span
+            if product & 0xFFFFFFFF < span:
+                threshold = (2 ** 32 - span) % span
+                while product & 0xFFFFFFFF < threshold:
+                    product = self.extract_number() * span
+            return low + (product >> 32)
+        out = self._output(size, out, np.int64)
+        spans = np.full(out.size, span, dtype=np.uint64)
+        np.add(self._bounded(spans).astype(np.int64), low,
+               out=out.reshape(-1))
+        return out
+
+    def _normal_tail(self, idx, rabs, x):
+        # The wedge and tail tests for a candidate that missed the fast path.
+        # Returns None when the candidate is rejected.
+        if idx == 0:
+            while True:
+                xx = -math.log1p(-self.random()) / _NORMAL_R
+                yy = -math.log1p(-self.random())
+                if yy + yy > xx * xx:
+                    if (rabs >> 8) & 1:
+                        return -(_NORMAL_R + xx)
+                    return _NORMAL_R + xx
+        fi = _NORMAL_FI
+        if (fi[idx - 1] - fi[idx]) * self.random() + fi[idx] \
+                < math.exp(-0.5 * x * x):
+            return x
+        return None
+
+    def standard_normal(self, size=None, out=None):
+        """
+        Returns standard normal variates from a 256-layer ziggurat.
+        Each candidate uses one 64-bit draw: 8 bits pick the layer, 1 bit the
+        sign and 52 bits the magnitude.
+        Candidates that miss the fast path (about 1 in 100) are finished one
+        at a time.
+        """
+        if size is None and out is None:
+            while True:
+                r = self._next_uint64()
+                idx = r & 0xff
+                r >>= 8
+                rabs = (r >> 1) & 0x000fffffffffffff
+                x = rabs * float(_NORMAL_WI[idx])
+                if r & 1:
+                    x = -x
+                if rabs < int(_NORMAL_KI[idx]):
+                    return x
+                x = self._normal_tail(idx, rabs, x)
+                if x is not None:
+                    return x
+        out = self._output(size, out, np.float64)
+        flat = out.reshape(-1)
+        r = self._next_uint64(flat.size)
+        idx = (r & np.uint64(0xff)).astype(np.intp)
+        r >>= np.uint64(8)
+        rabs = (r >> np.uint64(1)) & np.uint64(0x000fffffffffffff)
+        np.multiply(rabs, _NORMAL_WI[idx], out=flat)
+        np.negative(flat, out=flat, where=(r & np.uint64(1)).astype(bool))
+        for i in np.flatnonzero(rabs >= _NORMAL_KI[idx]):
+            x = self._normal_tail(int(idx[i]), int(rabs[i]), float(flat[i]))
+            flat[i] = self.standard_normal() if x is None else x
+        return out
+
+    def standard_exponential(self, size=None, out=None):
+        """
+        Returns exponential variates with mean 1 from a 256-layer ziggurat,
+        using 8 bits of a 64-bit draw for the layer and 53 for the magnitude.
+        """
+        if size is None and out is None:
+            while True:
+                r = self._next_uint64() >> 3
+                idx = r & 0xff
+                r >>= 8
+                x = r * float(_EXP_WE[idx])
+                if r < int(_EXP_KE[idx]):
+                    return x
+                x = self._exponential_tail(idx, x)
+                if x is not None:
+                    return x
+        out = self._output(size, out, np.float64)
+        flat = out.reshape(-1)
+        r = self._next_uint64(flat.size) >> np.uint64(3)
+        idx = (r & np.uint64(0xff)).astype(np.intp)
+        r >>= np.uint64(8)
+        np.multiply(r, _EXP_WE[idx], out=flat)
+        for i in np.flatnonzero(r >= _EXP_KE[idx]):
+            x = self._exponential_tail(int(idx[i]), float(flat[i]))
+            flat[i] = self.standard_exponential() if x is None else x
+        return out
+
+    def _exponential_tail(self, idx, x):
+        if idx == 0:
+            return _EXP_R - math.log1p(-self.random())
+        fe = _EXP_FE
+        if (fe[idx - 1] - fe[idx]) * self.random() + fe[idx] < math.exp(-x):
+            return x
+        return None
+
+    def _permutation(self, n):
+        """
+        Returns a uniformly random permutation of range(n) as an int64
+        array, by sorting n random 64-bit keys.
+        Keys are drawn again in the (unlikely) case of a tie, which would
+        otherwise favor the order of the tied indices.
+        """
+        while True:
+            keys = self._next_uint64(n)
+            order = np.argsort(keys)
+            ordered = keys[order]
+            if not np.any(ordered[1:] == ordered[:-1]):
+                return order
+
+    def shuffle(self, x):
+        """
+        Shuffles the list or NumPy array x in place.
+        The new order comes from sorting a bulk draw of random keys, so no
+        Python-level loop runs per element.
+        """
+        n = len(x)
+        if n < 2:
+            return
+        order = self._permutation(n)
+        if isinstance(x, np.ndarray):
+            x[...] = x[order]
+        else:
+            x[:] = [x[i] for i in order.tolist()]
+
+    def sample(self, population, k):
+        """
+        Returns k distinct elements chosen from population, as an array when
+        population is a NumPy array and as a list otherwise.
+        A small k takes k steps of a Fisher-Yates shuffle, keeping only the
+        swapped positions in a dict, so it costs O(k) whatever the size of
+        the population.
+        """
+        n = len(population)
+        if not 0 <= k <= n:
+            raise ValueError("sample larger than population or negative")
+        if k < n // 8:
+            offsets = self._bounded(np.arange(n, n - k, -1, dtype=np.uint64))
+            swapped = {}
+            chosen = []
+            for i, j in enumerate(offsets.tolist()):
+                j += i
+                chosen.append(swapped.get(j, j))
+                swapped[j] = swapped.get(i, i)
+        else:
+            chosen = self._permutation(n)[:k]
+        if isinstance(population, np.ndarray):
+            return population[chosen]
+        if not isinstance(chosen, list):
+            chosen = chosen.tolist()
+        return [population[i] for i in chosen]
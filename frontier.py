@@ -0,0 +1,182 @@
+"""
+The long-only efficient frontier, computed with the critical line algorithm
+instead of one quadratic program per point.
+
+For a risk tolerance t the optimal portfolio minimizes
+    1/2 w' cov w - t mu' w    subject to    sum(w) = 1, w >= 0.
+While the set of assets held (the free set) stays the same, the solution is
+linear in t, w = a + t b, where a and b come from one Cholesky factor of
+the covariance of the free assets.
+Starting from the single asset with the highest expected return (t very
+large) and lowering t, the free set only changes at turning points, where a
+held weight drops to zero or an asset's Lagrange multiplier does and it
+joins. Between turning points, every frontier portfolio is a blend of the
+two at either end, so any number of frontier points comes from the
+turning points without solving anything again.
+
+A sample covariance is singular when there are more assets than
+observations or an asset (cash) doesn't vary, and then it has no Cholesky
+factor. In that case a small ridge, ridge * I, is added to it (by default
+1e-10 times its mean variance, or 1e-10 if every variance is zero), which
+changes the risks by far less than their sampling error.
+
+-->
+>> from frontier import efficient_frontier
+>> weights, returns, risks = efficient_frontier(expected_returns, cov_quarterly)
+>> weights.shape
+(100, 4)
+-->
+"""
+import numpy as np
+
+try:
+    from scipy.linalg import cho_solve
+except ImportError:
+    cho_solve = None
+
+
+def _solve(cov, free, rhs):
+    """
+    Solves cov[free, free] x = rhs (columns) with one Cholesky factor.
+    """
+    factor = np.linalg.cholesky(cov[np.ix_(free, free)])
+    if cho_solve is not None:
+        return cho_solve((factor, True), rhs)
+    return np.linalg.solve(factor.T, np.linalg.solve(factor, rhs))
+
+
+def _segment(cov, mu, free):
+    # The weights of the free assets are a + t * b, and the multiplier of
+    # the budget constraint is gamma(t) = (t * s_mu - 1) / s_one.
+    solved = _solve(cov, free, np.column_stack((np.ones(len(free)), mu[free])))
+    c_one, c_mu = solved[:, 0], solved[:, 1]
+    s_one, s_mu = c_one.sum(), c_mu.sum()
+    a = c_one / s_one
+    b = c_mu - c_one * s_mu / s_one
+    return a, b, s_one, s_mu
+
+
+def _regularized(cov, ridge=None):
+    # cov itself if it is positive definite, otherwise cov + ridge * I.
+    try:
+        np.linalg.cholesky(cov)
+        return cov
+    except np.linalg.LinAlgError:
+        pass
+    if ridge is None:
+        ridge = 1e-10 * (np.trace(cov) / len(cov) or 1.0)
+    return cov + ridge * np.eye(len(cov))
+
+
+def turning_points(expected_returns, cov_matrix, tol=1e-10, ridge=None):
+    """
+    Returns the risk tolerances t of the turning points of the frontier,
+    from the highest-return portfolio down to t = 0 (the minimum variance
+    portfolio), and the (points, assets) matrix of their weights.
+    A singular cov_matrix gets ridge (see above) added to its diagonal.
+    """
+    mu = np.asarray(expected_returns, dtype=float)
+    cov = _regularized(np.asarray(cov_matrix, dtype=float), ridge)
+    n = len(mu)
+    # The frontier starts from the least risky portfolio of the assets tied
+    # for the best return. Their weights don't change with t (b is zero
+    # for them), so that mix has to be found up front: it is the end (t =
+    # 0) of the frontier of the tied assets alone, given distinct made-up
+    # returns.
+    best = mu.max()
+    tied = np.flatnonzero(mu >= best - tol * max(1.0, abs(best)))
+    start = np.zeros(n)
+    if len(tied) == 1:
+        start[tied[0]] = 1.0
+    else:
+        _, mixes = turning_points(np.arange(len(tied), dtype=float),
+                                  cov[np.ix_(tied, tied)], tol)
+        mix = np.where(mixes[-1] > tol, mixes[-1], 0.0)
+        start[tied] = mix / mix.sum()
+    free = list(np.flatnonzero(start))
+    ts = [np.inf]
+    points = [start]
+    t = np.inf
+    last_changed = None
+    while t > 0:
+        a, b, s_one, s_mu = _segment(cov, mu, free)
+        bounded = np.setdiff1d(np.arange(n), free)
+        # The highest t below the current one where the free set changes:
+        best, event, asset = 0.0, None, None
+        # A free weight a_j + t b_j with b_j > 0 falls to zero as t drops.
+        for j, (a_j, b_j) in enumerate(zip(a, b)):
+            if b_j > tol and free[j] != last_changed:
+                t_j = -a_j / b_j
+                if best < t_j < t:
+                    best, event, asset = t_j, "leave", free[j]
+        # The multiplier of a bounded asset i is c_i + t d_i, and it joins
+        # the free set once that reaches zero.
+        if len(bounded):
+            cross = cov[np.ix_(bounded, free)]
+            c = cross @ a - 1.0 / s_one
+            d = cross @ b - mu[bounded] + s_mu / s_one
+            for i, c_i, d_i in zip(bounded, c, d):
+                if d_i > tol and i != last_changed:
+                    t_i = -c_i / d_i
+                    if best < t_i < t:
+                        best, event, asset = t_i, "join", i
+        # Without another event, the segment runs down to t = 0, the
+        # minimum variance portfolio.
+        t = best
+        weights = np.zeros(n)
+        weights[free] = np.maximum(a + t * b, 0)
+        weights /= weights.sum()
+        ts.append(t)
+        points.append(weights)
+        if event == "leave":
+            free.remove(asset)
+        elif event == "join":
+            free.append(asset)
+        last_changed = asset
+    return np.array(ts), np.array(points)
+
+
+def efficient_frontier(expected_returns, cov_matrix, points=100, ridge=None):
+    """
+    Returns the (points, assets) weights, expected returns and risks
+    (standard deviations) of points portfolios along the long-only efficient
+    frontier, evenly spaced in expected return from the minimum variance
+    portfolio up to the best single asset.
+    The risks are those under cov_matrix itself, without any ridge.
+    """
+    mu = np.asarray(expected_returns, dtype=float)
+    cov = np.asarray(cov_matrix, dtype=float)
+    _, corners = turning_points(mu, cov, ridge=ridge)
+    # Lowest return first, and without repeated returns:
+    corners = corners[::-1]
+    corner_returns = corners @ mu
+    keep = np.concatenate(([True], np.diff(corner_returns) > 0))
+    corners, corner_returns = corners[keep], corner_returns[keep]
+
+    targets = np.linspace(corner_returns[0], corner_returns[-1], points)
+    # Weights are linear in expected return between neighbouring corners:
+    upper = np.clip(np.searchsorted(corner_returns, targets), 1,
+                    max(len(corners) - 1, 1))
+    if len(corners) == 1:
+        weights = np.repeat(corners, points, axis=0)
+    else:
+        lower = upper - 1
+        share = (targets - corner_returns[lower]) \
+            / (corner_returns[upper] - corner_returns[lower])
+        weights = corners[lower] \
+            + share[:, None] * (corners[upper] - corners[lower])
+    returns = weights @ mu
+    risks = np.sqrt(np.maximum(((weights @ cov) * weights).sum(axis=1), 0))
+    return weights, returns, risks
+
+
+def optimal_portfolio(returns, points=100):
+    """
+    Takes a DataFrame (or array) of periodic returns, one column per asset,
+    and returns the frontier weights, returns and risks for their mean and
+    sample covariance, in place of rf.optimal_portfolio.
+    Unlike rf's, the weights are those of every frontier point.
+    """
+    returns = np.asarray(returns, dtype=float)
+    return efficient_frontier(returns.mean(axis=0),
+                              np.cov(returns, rowvar=False), points)
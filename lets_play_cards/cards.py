@@ -1,3 +1,16 @@
+import random
+from array import array
+
+# Every card has an index from 0 to 51, suit * 13 + (rank - 1), so sorting by
+# index is the same as sorting with Card.cmp_().
+# A set of cards is then a 52-bit integer mask with bit i set when card i is
+# present, and membership, adding and removing are single bit operations.
+FULL_MASK = (1 << 52) - 1
+
+# One generator shared by every Deck, rather than a new one per shuffle:
+_shuffler = random.Random()
+
+
 class Card:
     """
     Use integers to encode the ranks and suits used in a deck of cards.
@@ -18,25 +31,56 @@ class Card:
     Diamonds
     -->
 
-    TODO:
-    Error handling for invalid inputs in suits and ranks.
-    Write a method or methods to compare the cards.
+    There are only ever 52 Card objects, plus one rank-0 "narf" placeholder
+    per suit for Card() and Card(suit).
+    Card(suit, rank) hands back the shared instance for that card, so cards
+    are immutable and cost nothing to "create".
+
+    -->
+    In [7]: Card(1, 11) is card1
+    Out[7]: True
+
+    In [8]: card1.index
+    Out[8]: 23
+    -->
+
     http://openbookproject.net/thinkcs/python/english3e/collections.html#comparing-cards
     """
+    __slots__ = ("suit", "rank", "index", "_order")
+
     suits = ["Clubs", "Diamonds", "Hearts", "Spades"]
     # "narf" is a placekeeper for the zeroth element, which we don't need.
     ranks = ["narf", "Ace", "2", "3", "4", "5", "6", "7", "8", "9", "10",
              "Jack", "Queen", "King"]
 
-    def __init__(self, suit=0, rank=0):
-        self.suit = suit
-        self.rank = rank
+    def __new__(cls, suit=0, rank=0):
+        if suit not in range(4) or rank not in range(14):
+            raise ValueError("There is no card with suit {0!r} and rank {1!r}"
+                             .format(suit, rank))
+        if rank == 0:
+            return _CARDS[52 + int(suit)]
+        return _CARDS[int(suit) * 13 + int(rank) - 1]
+
+    @staticmethod
+    def from_index(index):
+        """
+        Returns the card with the given index (0 to 51, or 52 to 55 for the
+        placeholders of each suit).
+        """
+        return _CARDS[index]
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card objects are shared and can't be changed")
+
+    def __reduce__(self):
+        # Unpickling goes back through Card() and so finds the shared instance.
+        return (Card, (self.suit, self.rank))
 
     def __str__(self):
         """
         Returns a string representation of the corresponding card.
         """
-        return (self.ranks[self.rank] + " of " + self.suits[self.suit])
+        return CARD_NAMES[self.index]
 
     def cmp_(self, other):
         """
@@ -55,48 +99,146 @@ class Card:
         True
         >
         """
-        # Check the suits
-        if self.suit > other.suit: return 1
-        if self.suit < other.suit: return -1
-        # Suits are compared, now check the ranks
-        if self.rank > other.rank: return 1
-        if self.rank < other.rank: return -1
-        # Ranks are compared, ties result in 0
+        # Suit takes precedence over rank, which is exactly the order of
+        # suit * 14 + rank (the order of the indices, apart from the
+        # placeholders):
+        if self._order > other._order: return 1
+        if self._order < other._order: return -1
         return 0
 
-    # Define the six special methods that overload each the relational operators
+    # Define the six special methods that overload each the relational
+    # operators.
+    # They compare the precomputed orders directly rather than going through
+    # cmp_.
     def __eq__(self, other):
-        return self.cmp_(other) == 0
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self.index == other.index
 
     def __le__(self, other):
-        return self.cmp_(other) <= 0
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self._order <= other._order
 
     def __ge__(self, other):
-        return self.cmp_(other) >= 0
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self._order >= other._order
 
     def __gt__(self, other):
-        return self.cmp_(other) > 0
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self._order > other._order
 
     def __lt__(self, other):
-        return self.cmp_(other) < 0
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self._order < other._order
 
     def __ne__(self, other):
-        return self.cmp_(other) != 0
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self.index != other.index
+
+    def __hash__(self):
+        return self.index
+
+
+# Build the 52 shared cards and then the four placeholders, bypassing
+# Card.__new__ and Card.__setattr__:
+_CARDS = []
+for _suit, _rank in ([(s, r) for s in range(4) for r in range(1, 14)] +
+                     [(s, 0) for s in range(4)]):
+    _card = object.__new__(Card)
+    object.__setattr__(_card, "suit", _suit)
+    object.__setattr__(_card, "rank", _rank)
+    object.__setattr__(_card, "index", len(_CARDS))
+    object.__setattr__(_card, "_order", _suit * 14 + _rank)
+    _CARDS.append(_card)
+_CARDS = tuple(_CARDS)
+
+# Rendering tables: CARD_NAMES[i] is the name of card i, and _LINES[p][i] is
+# the line for card i at position p of the cascade that Deck.__str__ prints,
+# so rendering a deck never builds a string piece by piece.
+CARD_NAMES = tuple(Card.ranks[card.rank] + " of " + Card.suits[card.suit]
+                   for card in _CARDS)
+_LINES = tuple(tuple(" " * p + name + "\n" for name in CARD_NAMES)
+               for p in range(52))
+
+
+def _cascade(indices):
+    """
+    Yields the lines of the cascade for a sequence of card indices.
+    """
+    for p, i in enumerate(indices):
+        if p < 52:
+            yield _LINES[p][i]
+        else:
+            yield " " * p + CARD_NAMES[i] + "\n"
+
+
+def write_hands(fp, hands):
+    """
+    Writes every hand (or deck) in hands to the text file fp, one after
+    another, without building a string for the whole batch.
+    """
+    for hand in hands:
+        hand.write_to(fp)
 
 
 class Deck:
     """
-    Each Deck object will contain a list of Card objects as an attribute.
+    A Deck keeps its cards in compact form: indices is an array('B') of card
+    indices in order (the last one is the next to be dealt) and mask is the
+    same set of cards as a bitmask.
+    The cards attribute is a tuple of Card objects built from indices.
+
+    remove() only clears the card's bit, in O(1), and leaves its index in
+    place; the stale indices are dropped the next time indices is read, or
+    skipped as pop() reaches them.
     """
     def __init__(self):
         """
-        Creates the cards attribute and generates a fifty-two card deck.
-        The deck is a list and each card object is a (suit, rank) tuple.
+        Generates a fifty-two card deck, ordered by suit and then by rank.
+        """
+        self.indices = array("B", range(52))
+        self.mask = FULL_MASK
+
+    @property
+    def indices(self):
+        if self._stale:
+            mask = self.mask
+            self._indices = array("B", [i for i in self._indices
+                                        if mask >> i & 1])
+            self._stale = 0
+        return self._indices
+
+    @indices.setter
+    def indices(self, indices):
+        self._indices = indices
+        self._stale = 0
+
+    @property
+    def cards(self):
+        """
+        A tuple of the Card objects, in order.
+        Assign a list to the attribute to replace the cards; use add(),
+        remove() and pop() to change them.
         """
-        self.cards = []
-        for suit in range(4):
-            for rank in range(1, 14):
-                self.cards.append(Card(suit, rank))
+        return tuple([_CARDS[i] for i in self.indices])
+
+    @cards.setter
+    def cards(self, cards):
+        self.indices = array("B", [card.index for card in cards])
+        self.mask = 0
+        for i in self.indices:
+            self.mask |= 1 << i
+
+    def __len__(self):
+        return len(self._indices) - self._stale
+
+    def __contains__(self, card):
+        return self.mask >> card.index & 1 == 1
 
     def print_deck(self):
         """
@@ -110,20 +252,23 @@ class Deck:
         This is an alternative to the print_deck method above.
         Returns a string representation of a Deck.
         The cards are a single string printed in a cascade over 52 lines.
+        The lines come from precomputed tables and are joined once.
         """
-        # s is an accumulator
-        s = ""
-        for i in range(len(self.cards)):
-            s = s + " " * i + str(self.cards[i]) + "\n"
-        return s
+        return "".join(_cascade(self.indices))
 
-    def shuffle(self):
+    def write_to(self, fp):
+        """
+        Writes the same text as str(self) to the text file fp, line by line.
+        """
+        fp.writelines(_cascade(self.indices))
+
+    def shuffle(self, rng=None):
         """
         Use the shuffle method from the random number generator.
+        rng can be any object with a shuffle method, such as a seeded
+        random.Random; by default all decks share one module-level generator.
         """
-        import random
-        rng = random.Random()
-        rng.shuffle(self.cards)
+        (rng or _shuffler).shuffle(self.indices)
 
     def deal(self, hands, num_cards=999):
         """
@@ -133,9 +278,7 @@ class Deck:
         If there aren't enogh cards, the method stops when all are dealt.
         """
         num_hands = len(hands)
-        for i in range(num_cards):
-            if self.is_empty():
-                break  # if there are no more cards
+        for i in range(min(num_cards, len(self))):
             card = self.pop()  # take the next card
             hand = hands[i % num_hands]  # decide whose turn it is
             hand.add(card)  # add a card to that hand
@@ -145,9 +288,12 @@ class Deck:
         Takes a card as a parameter and removes it.
         Returns True if the card was in the deck, False otherwise.
         """
-        if card in self.cards:
-            # the remove method checks for deep equality
-            self.cards.remove(card)
+        bit = 1 << card.index
+        if self.mask & bit:
+            # The mask answers the membership question with one bit test,
+            # and the index is left for indices or pop() to drop later.
+            self.mask ^= bit
+            self._stale += 1
             return True
         else:
             return False
@@ -158,13 +304,20 @@ class Deck:
         The last card in the list is removed, like dealing from the bottom
         of the deck.
         """
-        return self.cards.pop()
+        indices = self._indices
+        i = indices.pop()
+        while not self.mask >> i & 1:
+            # A card already taken out by remove():
+            self._stale -= 1
+            i = indices.pop()
+        self.mask ^= 1 << i
+        return _CARDS[i]
 
     def is_empty(self):
         """
         Returns True if the deck contains no cards.
         """
-        return self.cards == []
+        return self.mask == 0
 
 
 class Hand(Deck):
@@ -185,25 +338,39 @@ class Hand(Deck):
     -->
     """
     def __init__(self, name =""):
-        self.cards = []
+        self.indices = array("B")
+        self.mask = 0
         self.name = name
 
     def add(self, card):
         """
         The remove() method is inherited from Deck.
+        A hand holds each card at most once, as it would with a real deck,
+        so adding a card that is already there raises ValueError.
         """
-        self.cards.append(card)
+        bit = 1 << card.index
+        if self.mask & bit:
+            raise ValueError("{0} is already in the hand".format(card))
+        self.indices.append(card.index)
+        self.mask |= bit
 
     def __str__(self):
         """
         Overrides the one in the Deck class so we can include more information.
         """
-        s = "Hand for player " + self.name
+        return self._header() + Deck.__str__(self)
+
+    def _header(self):
         if self.is_empty():
-            s += " is empty\n"
-        else:
-            s += " contains: \n"
-        return s + Deck.__str__(self)
+            return "Hand for player " + self.name + " is empty\n"
+        return "Hand for player " + self.name + " contains: \n"
+
+    def write_to(self, fp):
+        """
+        Writes the same text as str(self) to fp, header first.
+        """
+        fp.write(self._header())
+        Deck.write_to(self, fp)
 
 
 class CardGame:
@@ -233,6 +400,23 @@ class CardGame:
 # the loser’s hand.
 ################################################################################
 
+# MATCHES[i] is the index of the card that pairs with card i in Old Maid:
+# the same rank in the other suit of the same color.
+MATCHES = tuple((3 - i // 13) * 13 + i % 13 for i in range(52))
+
+
+def pairs_mask(mask):
+    """
+    Returns the mask of the cards in mask whose matching card is also there.
+    Bits 0-12 of a mask are the clubs by rank, 13-25 the diamonds, 26-38 the
+    hearts and 39-51 the spades, so ANDing the rank masks of the two suits of
+    each color finds every pair at once.
+    """
+    black = mask & (mask >> 39) & 0x1fff
+    red = (mask >> 13) & (mask >> 26) & 0x1fff
+    return black | red << 13 | red << 26 | black << 39
+
+
 class OldMaidHand(Hand):
     """
     Inherits from Hand and provides an additional method called remove_matches()
@@ -265,32 +449,37 @@ class OldMaidHand(Hand):
     """
     def remove_matches(self):
         """
-        We start by making a copy of the list of cards, so that we can traverse the
-        copy while removing cards from the original.
-        Since self.cards is modified in the loop, we don’t want to use it to
-        control the traversal.
-        Python can get quite confused if it is traversing a list that is changing.
-        For each card in the hand, we figure out what the matching card is and go
-        looking for it.
         The match card has the same rank and the other suit of the same color.
         The expression:
         >> 3 - card.suit
         turns a Club (suit 0) into a Spade (suit 3) and a Diamond (suit 1) into a
         Heart (suit 2).
         You should satisfy yourself that the opposite operations also work.
-        f the match card is also in the hand, both cards are removed.
+        If the match card is also in the hand, both cards are removed.
+
+        Rather than looking for the match of every card in turn, the hand's
+        mask is split into one 13-bit rank mask per suit.
+        For every rank at once, clubs & spades are the black pairs and
+        diamonds & hearts the red ones (see pairs_mask()), so finding all of
+        the matches is a handful of bit operations, and removing them is one
+        pass over the hand that doesn't create any Card objects.
         """
-        count = 0
-        original_cards = self.cards[:]
-        for card in original_cards:
-            match = Card(3 - card.suit, card.rank)
-            if match in self.cards:
-                self.cards.remove(card)
-                self.cards.remove(match)
+        matched = pairs_mask(self.mask)
+        if not matched:
+            return 0
+        original_indices = self.indices
+        self.mask ^= matched
+        self.indices = array("B", [i for i in original_indices
+                                   if not matched >> i & 1])
+        # Report each pair once, in the order its first card sat in the hand:
+        unreported = matched
+        for i in original_indices:
+            if unreported >> i & 1:
+                match = MATCHES[i]
+                unreported ^= (1 << i) | (1 << match)
                 print("Match for player {0}: {1} matches {2}"
-                        .format(self.name, card, match))
-                count += 1
-        return count
+                        .format(self.name, _CARDS[i], _CARDS[match]))
+        return bin(matched).count("1") // 2
 
 
 class OldMaidGame(CardGame):
@@ -0,0 +1,106 @@
+"""
+Shuffles and deals thousands of decks at once.
+
+A batch of decks is a (K, n) uint8 array with one deck of card indices (see
+cards.py) per row, where the last column is the top of the deck, just like
+Deck.indices.
+Shuffling works on whole columns at a time and dealing is array slicing, so
+there is no Python-level work per card or per deck.
+
+-->
+>> from dealing import shuffled_decks, deal
+>> decks = shuffled_decks(1000000)
+>> hands, rest = deal(decks, num_hands=4, cards_each=5)
+>> hands.shape
+(1000000, 4, 5)
+-->
+"""
+import numpy as np
+
+from cards import Hand, _CARDS
+
+
+def shuffled_decks(num_decks, rng=None, exclude=(), method="fisher-yates"):
+    """
+    Returns a (num_decks, n) uint8 array of independently shuffled decks.
+    exclude lists cards (Card objects or indices) to leave out, like the
+    Queen of Clubs in Old Maid.
+    rng can be a numpy.random.Generator (the default is a fresh one) or
+    anything else with a random(size) method, such as MT19937 from
+    exercises/mersenne_twister.py.
+
+    method="fisher-yates" runs one vectorized Fisher-Yates step per column:
+    column i of every deck is swapped with a random column at or below it.
+    method="argsort" sorts random keys instead, which is simpler but does
+    O(n log n) work per deck.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    excluded = {getattr(card, "index", card) for card in exclude}
+    cards = np.array([i for i in range(52) if i not in excluded],
+                     dtype=np.uint8)
+    size = len(cards)
+    if method == "argsort":
+        order = np.asarray(rng.random((num_decks, size))).argsort(axis=1)
+        return cards[order]
+    if method != "fisher-yates":
+        raise ValueError("method must be 'fisher-yates' or 'argsort'")
+    # Work on the transpose, so that column i of every deck is one
+    # contiguous row, and draw the random numbers for all the steps at once.
+    # floor(u * (i + 1)) is uniform on 0..i to within the 53-bit resolution
+    # of u.
+    uniform = np.asarray(rng.random((size - 1, num_decks)))
+    columns = np.tile(cards[:, None], (1, num_decks))
+    flat = columns.reshape(-1)
+    offsets = np.arange(num_decks)
+    for i in range(size - 1, 0, -1):
+        j = (uniform[i - 1] * (i + 1)).astype(np.intp)
+        j *= num_decks
+        j += offsets
+        picked = flat[j]
+        flat[j] = columns[i]
+        columns[i] = picked
+    return np.ascontiguousarray(columns.T)
+
+
+def deal(decks, num_hands, cards_each):
+    """
+    Deals cards_each cards to each of num_hands hands from every deck, round
+    robin from the top of the deck as Deck.deal does.
+    Returns (hands, rest): hands is a (K, num_hands, cards_each) array in
+    which hands[k, h] holds the cards of hand h in the order they were dealt,
+    and rest is a (K, m) view of the cards left in each deck.
+    """
+    decks = np.asarray(decks)
+    dealt = num_hands * cards_each
+    if dealt > decks.shape[1]:
+        raise ValueError("There aren't enough cards to deal")
+    # Dealt card i goes to hand i % num_hands, and the deck is dealt from the
+    # end, so reversing the top of the deck and reshaping it to one row per
+    # round puts the hands in the columns.
+    top = decks[:, decks.shape[1] - dealt:][:, ::-1]
+    hands = top.reshape(len(decks), cards_each, num_hands).transpose(0, 2, 1)
+    return hands, decks[:, :decks.shape[1] - dealt]
+
+
+def hand_masks(hands):
+    """
+    Returns the bitmask (as in Deck.mask) of every hand in an array of card
+    indices, reducing over the last axis.
+    """
+    bits = np.left_shift(np.uint64(1), np.asarray(hands, dtype=np.uint64))
+    return np.bitwise_or.reduce(bits, axis=-1)
+
+
+def to_hands(dealt, names):
+    """
+    Turns one deck's worth of dealt hands, a (num_hands, cards_each) array,
+    into Hand objects with the given names.
+    """
+    hands = []
+    for name, indices in zip(names, dealt):
+        hand = Hand(name)
+        for i in indices.tolist():
+            hand.add(_CARDS[i])
+        hands.append(hand)
+    return hands
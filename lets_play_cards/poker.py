@@ -0,0 +1,237 @@
+"""
+Scores poker hands of five to seven cards dealt from cards.Deck.
+
+A score is an int from 1 (7-5-4-3-2 offsuit) to 7462 (a royal flush), and a
+higher score always means a better hand, so hands can be compared directly.
+There are exactly 7462 distinct five-card hands once suits are ignored.
+
+-->
+>> from cards import Card, Deck, Hand
+>> from poker import evaluate, category
+>> deck = Deck()
+>> deck.shuffle()
+>> hand = Hand("ben")
+>> deck.deal([hand], 7)
+>> score = evaluate(hand.cards)
+>> category(score)
+'Two Pair'
+-->
+
+No hand is ranked by looking at its cards one combination at a time.
+Every card rank gets a prime number, so the product of the primes of a hand
+identifies its ranks whatever their order (this is Cactus Kev's trick).
+One table, sorted by that product, holds the score of every multiset of
+five, six or seven ranks, which covers every hand without a flush.
+In a hand with a flush nothing beats the flush (quads or a full house
+would need at least eight cards), so a second table, indexed by the 13-bit
+mask of the suited ranks, covers the rest.
+The tables are built once, saved to poker_tables.npy next to this file and
+memory-mapped from there afterwards.
+"""
+import os
+from collections import Counter
+from itertools import combinations, combinations_with_replacement
+
+import numpy as np
+
+from cards import Card
+
+CATEGORIES = ["High Card", "Pair", "Two Pair", "Three of a Kind", "Straight",
+              "Flush", "Full House", "Four of a Kind", "Straight Flush"]
+# How many distinct hands there are in each category, worst first:
+_CATEGORY_SIZES = [1277, 2860, 858, 858, 10, 1277, 156, 156, 10]
+
+# Poker ranks run from 0 for a deuce to 12 for an ace, unlike Card.rank,
+# where the ace is 1.
+RANK_OF = np.array([(i % 13 - 1) % 13 for i in range(52)], dtype=np.int64)
+PRIMES = np.array([2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41],
+                  dtype=np.int64)
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "poker_tables.npy")
+_TABLE_VERSION = 1
+_tables = None
+
+
+def _straight_top(mask):
+    """
+    Returns the rank of the top card of the best straight in a 13-bit rank
+    mask, or -1 if there is none.
+    """
+    # Put a copy of the ace below the deuce for the wheel (5-4-3-2-A):
+    wide = (mask << 1) | (mask >> 12 & 1)
+    for top in range(12, 2, -1):
+        if wide >> (top - 3) & 0x1f == 0x1f:
+            return top
+    return -1
+
+
+def _flush_key(mask):
+    top = _straight_top(mask)
+    if top >= 0:
+        return (8, (top,))
+    ranks = [r for r in range(12, -1, -1) if mask >> r & 1]
+    return (5, tuple(ranks[:5]))
+
+
+def _best_key(counts):
+    """
+    Returns the key of the best five-card hand without a flush that can be
+    made from counts, a Counter of ranks holding five to seven cards.
+    Keys sort in the same order as the hands they describe.
+    """
+    by_count = sorted(counts.items(), key=lambda rc: (rc[1], rc[0]),
+                      reverse=True)
+    ranks = sorted(counts, reverse=True)
+    quads = [r for r, c in by_count if c == 4]
+    trips = [r for r, c in by_count if c == 3]
+    pairs = [r for r, c in by_count if c == 2]
+    if quads:
+        return (7, (quads[0], max(r for r in ranks if r != quads[0])))
+    if trips and (len(trips) > 1 or pairs):
+        pair = max(trips[1:] + pairs)
+        return (6, (trips[0], pair))
+    mask = 0
+    for r in ranks:
+        mask |= 1 << r
+    top = _straight_top(mask)
+    if top >= 0:
+        return (4, (top,))
+    if trips:
+        kickers = [r for r in ranks if r != trips[0]][:2]
+        return (3, (trips[0],) + tuple(kickers))
+    if len(pairs) >= 2:
+        kicker = max(r for r in ranks if r not in pairs[:2])
+        return (2, (pairs[0], pairs[1], kicker))
+    if pairs:
+        kickers = [r for r in ranks if r != pairs[0]][:3]
+        return (1, (pairs[0],) + tuple(kickers))
+    return (0, tuple(ranks[:5]))
+
+
+def build_tables():
+    """
+    Builds the lookup tables and returns them as one int64 array:
+    [version, n, flush scores by mask (8192), n sorted prime products,
+    the n matching scores].
+    """
+    # Every distinct five-card hand, as the key that orders it:
+    keys = set()
+    for ranks in combinations(range(13), 5):
+        mask = sum(1 << r for r in ranks)
+        keys.add(_flush_key(mask))
+        keys.add(_best_key(Counter(ranks)))
+    for ranks in combinations_with_replacement(range(13), 5):
+        counts = Counter(ranks)
+        if len(counts) < 5 and max(counts.values()) <= 4:
+            keys.add(_best_key(counts))
+    score_of = {key: score for score, key in enumerate(sorted(keys), 1)}
+    assert len(score_of) == sum(_CATEGORY_SIZES)
+
+    flush = np.zeros(8192, dtype=np.int64)
+    for mask in range(8192):
+        if 5 <= bin(mask).count("1") <= 7:
+            flush[mask] = score_of[_flush_key(mask)]
+
+    products = {}
+    for size in (5, 6, 7):
+        for ranks in combinations_with_replacement(range(13), size):
+            counts = Counter(ranks)
+            if max(counts.values()) <= 4:
+                product = int(np.prod(PRIMES[list(ranks)]))
+                products[product] = score_of[_best_key(counts)]
+    keys = np.array(sorted(products), dtype=np.int64)
+    scores = np.array([products[k] for k in keys.tolist()], dtype=np.int64)
+    return np.concatenate(([_TABLE_VERSION, len(keys)], flush, keys, scores))
+
+
+def load_tables(path=TABLE_PATH):
+    """
+    Returns the (flush, products, scores) tables, memory-mapped from path.
+    The file is built and written the first time, or if it is out of date.
+    """
+    global _tables
+    if _tables is not None and _tables[0] == path:
+        return _tables[1]
+    try:
+        data = np.load(path, mmap_mode="r")
+        if data[0] != _TABLE_VERSION:
+            raise ValueError("old table version")
+    except (OSError, ValueError, IndexError):
+        data = build_tables()
+        # Write to a temporary file first so that another process never
+        # maps a half-written table.
+        temporary = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temporary, "wb") as f:
+            np.save(f, data)
+        os.replace(temporary, path)
+        data = np.load(path, mmap_mode="r")
+    n = int(data[1])
+    flush = data[2:8194]
+    tables = (flush, data[8194:8194 + n], data[8194 + n:8194 + 2 * n])
+    _tables = (path, tables)
+    return tables
+
+
+def evaluate(cards):
+    """
+    Returns the score of the best five-card hand among cards, which can be a
+    list of five to seven Card objects or card indices.
+    """
+    flush, products, scores = load_tables()
+    indices = [card.index if isinstance(card, Card) else int(card)
+               for card in cards]
+    if not 5 <= len(indices) <= 7:
+        raise ValueError("A poker hand has five to seven cards")
+    suits = Counter(i // 13 for i in indices)
+    suit, count = suits.most_common(1)[0]
+    if count >= 5:
+        mask = 0
+        for i in indices:
+            if i // 13 == suit:
+                mask |= 1 << int(RANK_OF[i])
+        return int(flush[mask])
+    product = 1
+    for i in indices:
+        product *= int(PRIMES[RANK_OF[i]])
+    return int(scores[np.searchsorted(products, product)])
+
+
+def evaluate_batch(hands, chunk_size=1 << 16):
+    """
+    Scores every row of hands, an (N, k) integer array of card indices with
+    k from 5 to 7, and returns an int16 array of N scores.
+    """
+    flush, products, scores = load_tables()
+    hands = np.asarray(hands)
+    if hands.ndim != 2 or not 5 <= hands.shape[1] <= 7:
+        raise ValueError("hands must be an (N, 5..7) array of card indices")
+    result = np.empty(len(hands), dtype=np.int16)
+    suit_ids = np.arange(4)
+    for start in range(0, len(hands), chunk_size):
+        chunk = hands[start:start + chunk_size]
+        ranks = RANK_OF[chunk]
+        suits = chunk // 13
+        suit_counts = (suits[:, :, None] == suit_ids).sum(axis=1)
+        flush_suit = suit_counts.argmax(axis=1)
+        has_flush = suit_counts.max(axis=1) >= 5
+
+        in_flush = suits == flush_suit[:, None]
+        masks = np.bitwise_or.reduce(np.where(in_flush, 1 << ranks, 0),
+                                     axis=1)
+        product = PRIMES[ranks].prod(axis=1)
+        unsuited = scores[np.searchsorted(products, product)]
+        result[start:start + chunk_size] = np.where(has_flush, flush[masks],
+                                                    unsuited)
+    return result
+
+
+def category(score):
+    """
+    Returns the name of the category ("Flush", "Two Pair" ...) of a score.
+    """
+    for name, size in zip(CATEGORIES, _CATEGORY_SIZES):
+        if score <= size:
+            return name
+        score -= size
+    raise ValueError("Scores run from 1 to 7462")
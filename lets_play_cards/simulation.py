@@ -0,0 +1,249 @@
+"""
+A quiet Old Maid engine for playing a great many games and collecting
+statistics about them.
+
+It plays by the same rules as OldMaidGame in cards.py but keeps each hand as
+a list of card indices plus a bitmask, never prints, and picks a random card
+from the neighbor instead of shuffling the neighbor's whole hand after every
+turn.
+
+-->
+$ python simulation.py 100000 --players 4 --processes 4 --seed 1
+-->
+
+Anything that wants to watch the games can pass an on_event callback, which
+is called as on_event(kind, **details) for these kinds:
+    "deal"   hands (a list of lists of card indices, one per seat)
+    "match"  seat, card, match (card indices)
+    "pick"   seat, neighbor, card
+    "end"    loser, turns
+"""
+import argparse
+import hashlib
+import random
+from collections import Counter
+from multiprocessing import Pool
+
+from cards import Card, MATCHES, pairs_mask
+
+QUEEN_OF_CLUBS = Card(0, 12).index
+QUEEN_OF_SPADES = Card(3, 12).index
+
+
+class OldMaidStats:
+    """
+    Totals for a batch of games with the same number of players.
+    Stats from separate batches can be combined with merge().
+    """
+    def __init__(self, num_players):
+        self.num_players = num_players
+        self.games = 0
+        # losers[seat] counts the games lost by the player in that seat:
+        self.losers = [0] * num_players
+        # game_lengths[n] counts the games that took n turns (picks):
+        self.game_lengths = Counter()
+        # matches_per_turn[t] counts the matches made on turn t over all games:
+        self.matches_per_turn = Counter()
+        # initial_matches[n] counts the deals where n pairs were discarded
+        # before play began:
+        self.initial_matches = Counter()
+
+    def merge(self, other):
+        """
+        Adds the totals of other to this one and returns self.
+        """
+        if other.num_players != self.num_players:
+            raise ValueError("Can't merge stats for different player counts")
+        self.games += other.games
+        self.losers = [a + b for a, b in zip(self.losers, other.losers)]
+        self.game_lengths.update(other.game_lengths)
+        self.matches_per_turn.update(other.matches_per_turn)
+        self.initial_matches.update(other.initial_matches)
+        return self
+
+    def loser_distribution(self):
+        """
+        Returns the fraction of games lost by each seat (nan for each seat
+        before any games).
+        """
+        if not self.games:
+            return [float("nan")] * self.num_players
+        return [count / self.games for count in self.losers]
+
+    def mean_length(self):
+        if not self.games:
+            return float("nan")
+        return sum(n * count for n, count in self.game_lengths.items()) \
+            / self.games
+
+    def match_rates(self):
+        """
+        Returns a list whose item t is the chance that turn t made a match,
+        among the games that lasted that long (empty before any games).
+        """
+        if not self.game_lengths:
+            return []
+        longest = max(self.game_lengths)
+        # reached[t] is the number of games with at least t + 1 turns:
+        reached = [0] * (longest + 1)
+        for n, count in self.game_lengths.items():
+            reached[n - 1] += count
+        for t in range(longest - 1, -1, -1):
+            reached[t] += reached[t + 1]
+        return [self.matches_per_turn[t] / reached[t] for t in range(longest)]
+
+    def __str__(self):
+        if not self.games:
+            return "0 games with {0} players".format(self.num_players)
+        lines = ["{0} games with {1} players, {2:.1f} turns on average"
+                 .format(self.games, self.num_players, self.mean_length())]
+        for seat, share in enumerate(self.loser_distribution()):
+            lines.append("  seat {0} lost {1:.2%}".format(seat, share))
+        return "\n".join(lines)
+
+
+def play_game(num_players, rng, stats, on_event=None):
+    """
+    Plays one game of Old Maid and adds the result to stats.
+    rng can be anything with shuffle(list) and random() methods, such as
+    random.Random or MT19937 from exercises/mersenne_twister.py.
+    Returns the seat of the loser.
+    """
+    deck = list(range(52))
+    deck.remove(QUEEN_OF_CLUBS)
+    rng.shuffle(deck)
+    hands = [deck[seat::num_players] for seat in range(num_players)]
+    if on_event is not None:
+        on_event("deal", hands=[hand[:] for hand in hands])
+
+    # Discard the pairs in every hand before play begins:
+    masks = []
+    matches = 0
+    for seat, hand in enumerate(hands):
+        mask = 0
+        for card in hand:
+            mask |= 1 << card
+        matched = pairs_mask(mask)
+        if matched:
+            if on_event is not None:
+                unreported = matched
+                for card in hand:
+                    if unreported >> card & 1:
+                        unreported ^= (1 << card) | (1 << MATCHES[card])
+                        on_event("match", seat=seat, card=card,
+                                 match=MATCHES[card])
+            hands[seat] = [card for card in hand if not matched >> card & 1]
+            mask ^= matched
+            matches += bin(matched).count("1") // 2
+        masks.append(mask)
+    stats.initial_matches[matches] += 1
+
+    # Play until all 50 cards are matched:
+    seat = 0
+    turns = 0
+    draw = rng.random
+    while matches < 25:
+        hand = hands[seat]
+        if hand:
+            neighbor = (seat + 1) % num_players
+            while not hands[neighbor]:
+                neighbor = (neighbor + 1) % num_players
+            # Taking a random card is the same as taking the last card of a
+            # freshly shuffled hand.
+            source = hands[neighbor]
+            pos = int(draw() * len(source))
+            card = source[pos]
+            source[pos] = source[-1]
+            source.pop()
+            masks[neighbor] ^= 1 << card
+            if on_event is not None:
+                on_event("pick", seat=seat, neighbor=neighbor, card=card)
+
+            match = MATCHES[card]
+            if masks[seat] >> match & 1:
+                hand.remove(match)
+                masks[seat] ^= 1 << match
+                matches += 1
+                stats.matches_per_turn[turns] += 1
+                if on_event is not None:
+                    on_event("match", seat=seat, card=card, match=match)
+            else:
+                hand.append(card)
+                masks[seat] |= 1 << card
+            turns += 1
+        seat = (seat + 1) % num_players
+
+    for loser, mask in enumerate(masks):
+        if mask >> QUEEN_OF_SPADES & 1:
+            break
+    stats.games += 1
+    stats.losers[loser] += 1
+    stats.game_lengths[turns] += 1
+    if on_event is not None:
+        on_event("end", loser=loser, turns=turns)
+    return loser
+
+
+def chunk_seed(seed, chunk):
+    """
+    Derives the 32-bit seed for one chunk of games from the seed of the whole
+    run, so a run gives the same totals however its chunks are spread over
+    processes.
+    """
+    digest = hashlib.sha256("{0}:{1}".format(seed, chunk).encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def _play_chunk(job):
+    num_games, num_players, seed, rng_factory = job
+    rng = rng_factory(seed)
+    stats = OldMaidStats(num_players)
+    for _ in range(num_games):
+        play_game(num_players, rng, stats)
+    return stats
+
+
+def simulate(num_games, num_players=4, seed=None, processes=1,
+             chunk_size=10000, rng_factory=random.Random, on_event=None):
+    """
+    Plays num_games games and returns their OldMaidStats.
+    The games are split into chunks of chunk_size, and chunk i gets its own
+    generator, rng_factory(chunk_seed(seed, i)).
+    With processes other than 1 the chunks are played on a multiprocessing
+    pool (processes=None uses every CPU); the totals only depend on seed and
+    chunk_size.
+    rng_factory must then be picklable, and on_event isn't allowed since the
+    games happen in other processes.
+    """
+    if not 2 <= num_players <= 51:
+        raise ValueError("Old Maid needs between 2 and 51 players")
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    jobs = []
+    for chunk, start in enumerate(range(0, num_games, chunk_size)):
+        jobs.append((min(chunk_size, num_games - start), num_players,
+                     chunk_seed(seed, chunk), rng_factory))
+
+    stats = OldMaidStats(num_players)
+    if processes == 1:
+        for count, _, job_seed, _ in jobs:
+            rng = rng_factory(job_seed)
+            for _ in range(count):
+                play_game(num_players, rng, stats, on_event)
+        return stats
+    if on_event is not None:
+        raise ValueError("on_event only works with processes=1")
+    with Pool(processes) as pool:
+        for chunk_stats in pool.imap_unordered(_play_chunk, jobs):
+            stats.merge(chunk_stats)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate games of Old Maid.")
+    parser.add_argument("games", type=int)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    print(simulate(args.games, args.players, args.seed, args.processes))
@@ -1,4 +1,28 @@
-import matplotlib.pyplot as plt
+"""
+Net present value profiles, IRR and MIRR for many projects at once.
+
+Run as a script to plot the NPV profiles of Project A and Project B, or
+import the functions and hand them a whole portfolio of projects:
+
+-->
+>> from net_present_value import npv_profile, irr
+>> npv_profile([project_a, project_b], discount_rate).shape
+(2, 27)
+>> irr([project_a, project_b])
+array([0.1476..., 0.1683...])
+-->
+
+Ledgers too big for memory can be streamed from a CSV file or any iterator,
+in one pass and constant memory, for many rates at once:
+
+-->
+>> npv_stream("ledger.csv", discount_rate, column="amount")
+-->
+"""
+import warnings
+from itertools import chain, islice
+
+import numpy as np
 
 # Update Project A Cash Flows Here
 project_a = [-1000000, 0, 0, 50000, 50000, 200000, 250000, 250000, 250000, 250000, 375000, 375000, 375000, 375000, 375000, 250000, 250000, 250000, 250000, 100000]
@@ -14,19 +38,238 @@ def calculate_npv(rate, cash_flow):
         npv += cash_flow[t]/(1+rate)**t
     return npv
 
-npvs_a = list()
-npvs_b = list()
-for rate in discount_rate:
-    npv_a = calculate_npv(rate, project_a)
-    npvs_a.append(npv_a)
-    npv_b = calculate_npv(rate, project_b)
-    npvs_b.append(npv_b)
-
-plt.plot(discount_rate,npvs_a,linewidth=2.0,color='red',label='Project A')
-plt.plot(discount_rate,npvs_b,linewidth=2.0,color='blue',label='Project B')
-plt.axhline(y=0,linewidth=0.5,color='black')
-plt.title('NPV Profile for Projects A and B')
-plt.xlabel('Discount Rate')
-plt.ylabel('Net Present Value')
-plt.legend()
-plt.show()
+def cash_flow_matrix(cash_flows):
+    """
+    Turns a list of cash flow lists (projects of any length) into a
+    (projects, periods) float array padded with zeros at the end, and
+    returns it with the length of each project.
+    A single flat list counts as one project.
+    """
+    if np.ndim(cash_flows[0]) == 0:
+        cash_flows = [cash_flows]
+    lengths = np.array([len(flows) for flows in cash_flows])
+    matrix = np.zeros((len(cash_flows), lengths.max()))
+    for row, flows in zip(matrix, cash_flows):
+        row[:len(flows)] = flows
+    return matrix, lengths
+
+def discount_factors(rates, periods):
+    """
+    Returns the (rates, periods) table of (1 + rate) ** -t, built as a
+    cumulative product of 1 / (1 + rate) rather than a power per cell.
+    """
+    rates = np.asarray(rates, dtype=float).reshape(-1)
+    table = np.empty((len(rates), periods))
+    table[:, 0] = 1.0
+    table[:, 1:] = (1.0 / (1.0 + rates))[:, None]
+    return np.cumprod(table, axis=1, out=table)
+
+def npv_profile(cash_flows, rates):
+    """
+    Returns the (projects, rates) matrix of net present values, with one
+    matrix product of the cash flows and the discount factor table.
+    """
+    matrix, _ = cash_flow_matrix(cash_flows)
+    return matrix @ discount_factors(rates, matrix.shape[1]).T
+
+def _npv_and_slope(matrix, rates):
+    # NPV and its derivative with respect to the rate, one rate per project,
+    # both scaled by the same positive factor so that neither overflows:
+    # the discount factors are taken in log space, less their largest value
+    # over the periods with a cash flow.
+    # The scale leaves the sign of the NPV and the Newton step f / slope as
+    # they are.
+    periods = np.arange(matrix.shape[1])
+    logs = -np.log1p(rates)[:, None] * periods
+    logs = np.where(matrix != 0, logs, -np.inf)
+    largest = logs.max(axis=1, keepdims=True)
+    largest[~np.isfinite(largest)] = 0.0
+    factors = np.exp(logs - largest)
+    npv = (matrix * factors).sum(axis=1)
+    slope = -(matrix * periods * factors).sum(axis=1) / (1.0 + rates)
+    return npv, slope
+
+def irr(cash_flows, low=-0.99, high=10.0, tol=1e-12, max_iter=100,
+        guess=0.1, scan=256):
+    """
+    Returns the internal rate of return of every project, the rate where its
+    NPV is zero, searching between low and high.
+    The NPV is first evaluated at scan rates spread evenly in log(1 + rate)
+    between low and high, and each project's root is bracketed by the
+    sign change nearest to guess.
+    Then all the projects are solved together with a safeguarded Newton
+    method: each project keeps its bracket around the root, and takes a
+    Newton step only where the step lands inside the bracket and is less
+    than half the step before last, so it is sure to shrink the bracket;
+    otherwise it bisects.
+    Projects whose NPV doesn't change sign at any of the scanned rates, or
+    that haven't converged to within tol after max_iter steps, get nan.
+    When the cash flows change sign more than once there can be several
+    rates with NPV zero; this finds the one in the bracket nearest to
+    guess, and can miss two roots closer together than the scan's spacing.
+    """
+    matrix, _ = cash_flow_matrix(cash_flows)
+    count = len(matrix)
+    rows = np.arange(count)
+    grid = np.expm1(np.linspace(np.log1p(low), np.log1p(high), scan))
+    values = np.column_stack([_npv_and_slope(matrix, np.full(count, r))[0]
+                              for r in grid])
+    signs = np.sign(values)
+    change = (signs[:, :-1] != signs[:, 1:]) | (signs[:, :-1] == 0)
+    distance = np.where(change, np.abs((grid[:-1] + grid[1:]) / 2 - guess),
+                        np.inf)
+    nearest = distance.argmin(axis=1)
+    found = np.isfinite(distance[rows, nearest])
+    lo, hi = grid[nearest], grid[nearest + 1]
+    f_lo, f_hi = values[rows, nearest], values[rows, nearest + 1]
+    rate = np.where(f_lo == 0, lo, np.where(f_hi == 0, hi, (lo + hi) / 2))
+    active = found & (f_lo != 0) & (f_hi != 0)
+    # Start from the guess where the bracket allows it:
+    start = np.clip(guess, lo, hi)
+    rate[active] = start[active]
+    # The last two steps taken, as in Numerical Recipes' rtsafe:
+    step = hi - lo
+    step_before = hi - lo
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        index = np.flatnonzero(active)
+        x = rate[index]
+        f, slope = _npv_and_slope(matrix[index], x)
+        # Keep the root bracketed:
+        same_side = np.sign(f) == np.sign(f_lo[index])
+        lo[index] = np.where(same_side, x, lo[index])
+        f_lo[index] = np.where(same_side, f, f_lo[index])
+        hi[index] = np.where(same_side, hi[index], x)
+
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            newton = f / slope
+        target = x - newton
+        use_newton = np.isfinite(target) & (target > lo[index]) \
+            & (target < hi[index]) \
+            & (np.abs(newton) < 0.5 * np.abs(step_before[index]))
+        middle = (lo[index] + hi[index]) / 2
+        new_rate = np.where(use_newton, target, middle)
+        step_before[index] = step[index]
+        step[index] = new_rate - x
+        rate[index] = np.where(f == 0, x, new_rate)
+        width = tol * (1 + np.abs(rate[index]))
+        done = (f == 0) | (np.abs(step[index]) <= width) \
+            | (hi[index] - lo[index] <= width)
+        active[index[done]] = False
+
+    rate[~found | active] = np.nan
+    return rate
+
+def mirr(cash_flows, finance_rate, reinvest_rate):
+    """
+    Returns the modified internal rate of return of every project: negative
+    cash flows are discounted at finance_rate, positive ones compounded to
+    the end of the project at reinvest_rate.
+    Projects with no negative or no positive cash flows get nan.
+    """
+    matrix, lengths = cash_flow_matrix(cash_flows)
+    periods = matrix.shape[1]
+    finance = discount_factors(finance_rate, periods)[0]
+    reinvest = discount_factors(reinvest_rate, periods)[0]
+    present_cost = (np.minimum(matrix, 0) * finance).sum(axis=1)
+    # Compounding to the end of each project is discounting to time zero
+    # and growing back over the project's own length:
+    future_value = (np.maximum(matrix, 0) * reinvest).sum(axis=1) \
+        * (1.0 + reinvest_rate) ** (lengths - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = (future_value / -present_cost) ** (1.0 / (lengths - 1)) - 1
+    result[(present_cost == 0) | (future_value == 0)] = np.nan
+    return result
+
+def read_cash_flows(path, column=0, chunk_size=65536, delimiter=","):
+    """
+    Yields the cash flows in one column of a CSV file (by index, or by name
+    from the header row) as float arrays of up to chunk_size values.
+    Only one chunk is in memory at a time.
+    """
+    with open(path) as f:
+        header = f.readline().rstrip("\r\n").split(delimiter)
+        if isinstance(column, str):
+            column = header.index(column)
+        else:
+            # There is no header if the first row is already numbers:
+            try:
+                first = [float(header[column])]
+            except ValueError:
+                first = []
+            if first:
+                yield np.array(first)
+        while True:
+            with warnings.catch_warnings():
+                # loadtxt warns when it reaches the end of the file.
+                warnings.simplefilter("ignore", UserWarning)
+                chunk = np.loadtxt(f, delimiter=delimiter, usecols=column,
+                                   max_rows=chunk_size, ndmin=1)
+            if not len(chunk):
+                return
+            yield chunk
+
+def _chunks(cash_flows, chunk_size):
+    # Groups an iterator of numbers into arrays, and passes arrays through.
+    items = iter(cash_flows)
+    for first in items:
+        if np.ndim(first) == 0:
+            items = chain([first], items)
+            while True:
+                chunk = np.fromiter(islice(items, chunk_size), dtype=float)
+                if not len(chunk):
+                    return
+                yield chunk
+        yield np.asarray(first, dtype=float)
+        for chunk in items:
+            yield np.asarray(chunk, dtype=float)
+
+def npv_stream(cash_flows, rates, chunk_size=65536, max_table=1 << 22,
+               **read_options):
+    """
+    Returns the NPV of one long series of cash flows at every rate in rates,
+    reading it in a single pass.
+    cash_flows can be a path to a CSV file (read with read_cash_flows and
+    read_options), an iterator of numbers, or an iterator of arrays.
+    Each chunk costs one product with a (rates, width) discount factor table
+    that is built once; a per-rate factor carries the discounting from one
+    chunk to the next, so memory doesn't grow with the length of the ledger.
+    The table's width is chunk_size cut down to at most max_table cells in
+    all (32 MiB by default), so memory doesn't grow with the number of rates
+    either; longer chunks are taken a table's width at a time.
+    """
+    rates = np.asarray(rates, dtype=float).reshape(-1)
+    width = max(1, min(chunk_size, max_table // max(len(rates), 1)))
+    if isinstance(cash_flows, str):
+        chunks = read_cash_flows(cash_flows, chunk_size=width,
+                                 **read_options)
+    else:
+        chunks = _chunks(cash_flows, width)
+    npv = np.zeros(len(rates))
+    # factor is (1 + rate) ** -t for the first period of the next piece.
+    factor = np.ones(len(rates))
+    table = discount_factors(rates, width)
+    step = 1.0 / (1.0 + rates)
+    for chunk in chunks:
+        for start in range(0, len(chunk), width):
+            piece = chunk[start:start + width]
+            length = len(piece)
+            npv += factor * (table[:, :length] @ piece)
+            factor *= table[:, length - 1] * step
+    return npv
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    npvs_a, npvs_b = npv_profile([project_a, project_b], discount_rate)
+
+    plt.plot(discount_rate,npvs_a,linewidth=2.0,color='red',label='Project A')
+    plt.plot(discount_rate,npvs_b,linewidth=2.0,color='blue',label='Project B')
+    plt.axhline(y=0,linewidth=0.5,color='black')
+    plt.title('NPV Profile for Projects A and B')
+    plt.xlabel('Discount Rate')
+    plt.ylabel('Net Present Value')
+    plt.legend()
+    plt.show()
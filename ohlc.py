@@ -0,0 +1,245 @@
+"""
+Vectorized OHLC bars for candlestick_chart.py.
+
+resample() turns bars (or ticks) into bars of a longer period without a
+Python loop over the rows: every date becomes an integer bucket number for
+its period, the bucket boundaries come from where that number changes, and
+each column is reduced over the buckets at once with ufunc.reduceat
+(first Open, max High, min Low, last Close, summed Volume).
+
+-->
+>> from column_cache import load_columns
+>> from ohlc import resample, candlestick_rows
+>> monthly = resample(load_columns('AAPL_data.csv'), 'M')
+>> candlestick_rows(monthly)[:2]
+array([[16314.  ,   100.589996, ...]])
+-->
+
+Periods are 'D', 'W' (weeks starting on Monday), 'M', 'Q' and 'Y', with an
+optional multiple in front, like '2W' or '6M'.
+
+For series far longer than the screen is wide, OHLCPyramid keeps the bars
+at several levels of detail, each merging pairs of bars of the level below,
+and draw_candlesticks only ever draws the level and the stretch of it that
+the axes can show, redrawing when the x limits change:
+
+-->
+>> pyramid = OHLCPyramid(candlestick_rows(load_columns('ticks.csv')))
+>> draw_candlesticks(ax, pyramid, colorup='green', colordown='red')
+-->
+"""
+import re
+
+import numpy as np
+
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+_UNITS = {"D": "D", "W": "D", "M": "M", "Q": "M", "Y": "Y"}
+# 1970-01-01, day 0 of datetime64, was a Thursday; shifting by three days
+# makes week 0 start on Monday 1969-12-29.
+_WEEK_SHIFT = 3
+
+
+def _parse_period(period):
+    match = re.fullmatch(r"(\d*)([DWMQY])", period)
+    if match is None:
+        raise ValueError("Unknown period {0!r}".format(period))
+    return int(match.group(1) or 1), match.group(2)
+
+
+def to_datetime64(dates):
+    """
+    Returns dates (datetime64 values, date strings, or anything numpy can
+    read as dates) as a datetime64[s] array.
+    """
+    return np.asarray(dates).astype("datetime64[s]")
+
+
+def date2num(dates, epoch="1970-01-01T00:00:00"):
+    """
+    Returns dates as float days since epoch, like matplotlib.dates.date2num
+    with its default epoch, for a whole array at once.
+    """
+    seconds = to_datetime64(dates) - np.datetime64(epoch, "s")
+    return seconds.astype(np.int64) / 86400.0
+
+
+def period_buckets(dates, period):
+    """
+    Returns an int64 array numbering the period each date falls in; dates
+    in the same period get the same number, and later periods bigger ones.
+    """
+    multiple, unit = _parse_period(period)
+    buckets = to_datetime64(dates).astype("datetime64[" + _UNITS[unit] + "]") \
+        .astype(np.int64)
+    if unit == "W":
+        buckets = (buckets + _WEEK_SHIFT) // 7
+    elif unit == "Q":
+        buckets //= 3
+    return buckets // multiple
+
+
+def period_start(buckets, period):
+    """
+    Returns the first day of each period numbered by period_buckets.
+    """
+    multiple, unit = _parse_period(period)
+    buckets = np.asarray(buckets, dtype=np.int64) * multiple
+    if unit == "W":
+        return (buckets * 7 - _WEEK_SHIFT).astype("datetime64[D]")
+    if unit == "Q":
+        buckets = buckets * 3
+    return buckets.astype("datetime64[" + _UNITS[unit] + "]") \
+        .astype("datetime64[D]")
+
+
+def resample(bars, period, date="Date"):
+    """
+    Aggregates bars into one bar per period and returns a dict of arrays
+    with the date column (the first day of each period) and whichever of
+    Open, High, Low, Close and Volume bars has.
+    bars can be a DataFrame or a dict of columns, such as
+    column_cache.load_columns returns; rows that aren't in date order are
+    sorted first.
+    For ticks, pass the same price column as Open, High, Low and Close.
+    """
+    dates = to_datetime64(bars[date])
+    columns = [name for name in COLUMNS if name in bars]
+    values = {name: np.asarray(bars[name]) for name in columns}
+    if len(dates) and (dates[1:] < dates[:-1]).any():
+        order = np.argsort(dates, kind="stable")
+        dates = dates[order]
+        values = {name: column[order] for name, column in values.items()}
+
+    buckets = period_buckets(dates, period)
+    starts = np.flatnonzero(np.diff(buckets)) + 1
+    starts = np.concatenate(([0], starts)) if len(dates) else starts
+    ends = np.append(starts[1:], len(dates))[:len(starts)] - 1
+
+    result = {date: period_start(buckets[starts], period)}
+    for name in columns:
+        column = values[name]
+        if name == "Open":
+            result[name] = column[starts]
+        elif name == "High":
+            result[name] = np.maximum.reduceat(column, starts)
+        elif name == "Low":
+            result[name] = np.minimum.reduceat(column, starts)
+        elif name == "Close":
+            result[name] = column[ends]
+        else:
+            result[name] = np.add.reduceat(column, starts)
+    return result
+
+
+def candlestick_rows(bars, date="Date"):
+    """
+    Returns the (N, 5) float array of date number, Open, High, Low and Close
+    that mpl_finance.candlestick_ohlc draws.
+    """
+    rows = np.empty((len(bars[date]), 5))
+    rows[:, 0] = date2num(bars[date])
+    for i, name in enumerate(COLUMNS[:4], 1):
+        rows[:, i] = bars[name]
+    return rows
+
+
+def _merge_pairs(rows):
+    # One bar for every two: the first date and Open, the highest High,
+    # the lowest Low and the last Close (an odd last bar stays on its own).
+    starts = np.arange(0, len(rows), 2)
+    merged = np.empty((len(starts), 5))
+    merged[:, :2] = rows[starts, :2]
+    merged[:, 2] = np.maximum.reduceat(rows[:, 2], starts)
+    merged[:, 3] = np.minimum.reduceat(rows[:, 3], starts)
+    merged[:, 4] = rows[np.minimum(starts + 1, len(rows) - 1), 4]
+    return merged
+
+
+class OHLCPyramid:
+    """
+    Candlestick rows (as candlestick_rows returns, in date order) at every
+    level of detail: level 0 is the rows themselves and level k + 1 has one
+    bar for each pair of bars of level k, down to a single bar.
+    All the levels together take about twice the memory of level 0.
+    """
+    def __init__(self, rows):
+        rows = np.asarray(rows, dtype=float)
+        self.levels = [rows]
+        while len(rows) > 1:
+            rows = _merge_pairs(rows)
+            self.levels.append(rows)
+
+    def level_for(self, x0, x1, pixels, pixels_per_bar=3):
+        """
+        Returns the most detailed level with no more than one bar for every
+        pixels_per_bar pixels between the date numbers x0 and x1.
+        """
+        dates = self.levels[0][:, 0]
+        count = np.searchsorted(dates, x1, "right") \
+            - np.searchsorted(dates, x0, "left")
+        most = max(int(pixels // pixels_per_bar), 1)
+        level = 0
+        while count > most and level < len(self.levels) - 1:
+            count = (count + 1) // 2
+            level += 1
+        return level
+
+    def view(self, x0, x1, pixels, pixels_per_bar=3):
+        """
+        Returns the level chosen by level_for and the rows of that level
+        between x0 and x1, plus one bar either side so that candles cut by
+        the edges of the axes are still drawn.
+        """
+        level = self.level_for(x0, x1, pixels, pixels_per_bar)
+        rows = self.levels[level]
+        start = max(np.searchsorted(rows[:, 0], x0, "left") - 1, 0)
+        stop = np.searchsorted(rows[:, 0], x1, "right") + 1
+        return level, rows[start:stop]
+
+
+def draw_candlesticks(ax, pyramid, width=None, pixels_per_bar=3, draw=None,
+                      **options):
+    """
+    Draws the candles of pyramid that fit the current x limits and pixel
+    width of ax, and draws them again whenever the x limits change, so the
+    cost of a frame depends on the size of the axes rather than of the data.
+    width is the width of a level 0 candle in days (by default 0.6 of the
+    usual gap between bars); a level k candle is 2 ** k times as wide.
+    draw defaults to mpl_finance.candlestick_ohlc, and gets the options.
+    """
+    if draw is None:
+        from mpl_finance import candlestick_ohlc as draw
+    full = pyramid.levels[0]
+    if width is None:
+        width = 0.6 * np.median(np.diff(full[:, 0])) if len(full) > 1 else 0.6
+    drawn = []
+    state = {"busy": False}
+
+    def redraw(ax):
+        if state["busy"]:
+            return
+        state["busy"] = True
+        try:
+            x0, x1 = ax.get_xlim()
+            level, rows = pyramid.view(x0, x1, ax.get_window_extent().width,
+                                       pixels_per_bar)
+            for artist in drawn:
+                artist.remove()
+            lines, patches = draw(ax, rows, width=width * 2 ** level,
+                                  **options)
+            drawn[:] = list(lines) + list(patches)
+            # Drawing autoscales the axes; keep the limits being viewed.
+            ax.set_xlim(x0, x1, emit=False)
+            ax.figure.canvas.draw_idle()
+        finally:
+            state["busy"] = False
+
+    if len(full):
+        margin = max(width, (full[-1, 0] - full[0, 0]) / 50)
+        ax.set_xlim(full[0, 0] - margin, full[-1, 0] + margin)
+        low, high = full[:, 3].min(), full[:, 2].max()
+        ax.set_ylim(low - (high - low) / 20, high + (high - low) / 20)
+    ax.autoscale(False)
+    redraw(ax)
+    ax.callbacks.connect("xlim_changed", redraw)
+    return drawn
@@ -0,0 +1,121 @@
+"""
+Random portfolios for efficient_frontier.py, generated in batches.
+
+Instead of one portfolio at a time, each batch draws a whole (N, assets)
+matrix of weights from a Dirichlet distribution (so every row is positive
+and sums to 1), and gets the expected return of every row as W @ mu and
+the volatility as sqrt(sum((W @ cov) * W, axis=1)), the diagonal of
+W cov W^T without building the N x N matrix.
+
+-->
+>> from portfolios import random_portfolios, return_portfolios
+>> returns, volatility, weights = random_portfolios(10**6, expected_returns,
+..                                                   cov_quarterly, seed=1)
+>> return_portfolios(expected_returns, cov_quarterly).head()   # a DataFrame
+-->
+
+Batches of chunk_size portfolios are generated one at a time, or on a pool
+of processes, each from its own numpy SeedSequence child, so the results
+depend only on the seed and chunk_size.
+With keep_weights=False only the returns and volatilities are kept, and
+iter_portfolios yields the batches without keeping anything.
+"""
+from multiprocessing import Pool
+
+import numpy as np
+
+
+def random_weights(count, num_assets, rng, alpha=1.0):
+    """
+    Returns a (count, num_assets) matrix of Dirichlet(alpha) weights; the
+    default alpha of 1 spreads them uniformly over all long-only portfolios.
+    """
+    weights = rng.standard_gamma(alpha, (count, num_assets))
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights
+
+
+def portfolio_stats(weights, expected_returns, cov_matrix):
+    """
+    Returns the expected returns and volatilities of the rows of weights.
+    """
+    weights = np.asarray(weights, dtype=float)
+    returns = weights @ np.asarray(expected_returns, dtype=float)
+    variance = ((weights @ np.asarray(cov_matrix, dtype=float)) * weights) \
+        .sum(axis=1)
+    return returns, np.sqrt(np.maximum(variance, 0))
+
+
+def _portfolio_chunk(job):
+    count, expected_returns, cov_matrix, seed, alpha, keep_weights = job
+    rng = np.random.default_rng(seed)
+    weights = random_weights(count, len(expected_returns), rng, alpha)
+    returns, volatility = portfolio_stats(weights, expected_returns,
+                                          cov_matrix)
+    return returns, volatility, weights if keep_weights else None
+
+
+def iter_portfolios(num_portfolios, expected_returns, cov_matrix, seed=None,
+                    chunk_size=100000, processes=1, alpha=1.0,
+                    keep_weights=True):
+    """
+    Yields (returns, volatility, weights) for batches of at most chunk_size
+    random portfolios, num_portfolios in all, in the same order whatever
+    the number of processes (processes=None uses every CPU).
+    weights is None with keep_weights=False.
+    """
+    expected_returns = np.asarray(expected_returns, dtype=float)
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    starts = range(0, num_portfolios, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    jobs = [(min(chunk_size, num_portfolios - start), expected_returns,
+             cov_matrix, child, alpha, keep_weights)
+            for start, child in zip(starts, seeds)]
+    if processes == 1:
+        for job in jobs:
+            yield _portfolio_chunk(job)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(_portfolio_chunk, jobs)
+
+
+def random_portfolios(num_portfolios, expected_returns, cov_matrix, seed=None,
+                      chunk_size=100000, processes=1, alpha=1.0,
+                      keep_weights=True):
+    """
+    Returns the expected returns, volatilities and (unless keep_weights is
+    False, then None) the (num_portfolios, assets) weights of num_portfolios
+    random portfolios.
+    """
+    num_assets = len(expected_returns)
+    returns = np.empty(num_portfolios)
+    volatility = np.empty(num_portfolios)
+    weights = np.empty((num_portfolios, num_assets)) if keep_weights else None
+    start = 0
+    for chunk in iter_portfolios(num_portfolios, expected_returns, cov_matrix,
+                                 seed, chunk_size, processes, alpha,
+                                 keep_weights):
+        stop = start + len(chunk[0])
+        returns[start:stop] = chunk[0]
+        volatility[start:stop] = chunk[1]
+        if keep_weights:
+            weights[start:stop] = chunk[2]
+        start = stop
+    return returns, volatility, weights
+
+
+def return_portfolios(expected_returns, cov_matrix, num_portfolios=5000,
+                      seed=None, **options):
+    """
+    Returns random portfolios as a DataFrame with a Returns and a Volatility
+    column and then a "<symbol> Weight" column for each asset, like
+    rf.return_portfolios did.
+    expected_returns should be a pandas Series indexed by symbol.
+    """
+    import pandas as pd
+    returns, volatility, weights = random_portfolios(
+        num_portfolios, expected_returns, cov_matrix, seed, **options)
+    portfolio = {'Returns': returns, 'Volatility': volatility}
+    for counter, symbol in enumerate(expected_returns.index):
+        portfolio[str(symbol) + ' Weight'] = weights[:, counter]
+    return pd.DataFrame(portfolio)
@@ -0,0 +1,369 @@
+"""
+One aligned panel of the Quarterly Financial Report series in
+quarterly-financial-report-u.s.-corporations-data/.
+
+Each QFR*.csv there is one series (date,realtime_end,realtime_start,value)
+and each *_metadata.json describes one series in FRED's format.
+load_panel() reads them all into a Panel: a (series, quarter) matrix of
+values over the union of the dates, with a catalog of each series' title,
+units and so on from the metadata.
+
+-->
+>> from qfr import load_panel
+>> panel = load_panel()
+>> panel.ids[:2]
+['QFR101385USNO', 'QFR101INFUSNO']
+>> panel['QFR101MFGUSNO'][-1]            # the latest quarter
+>> panel.catalog['QFR104MFGUSNO']['title']
+'Quarterly Financial Report: U.S. Corporations: Income (Loss) from Operations: ...'
+>> panel.to_frame()                      # a DataFrame, quarters by series
+-->
+
+A Panel holds one value per series and quarter, the latest.
+For point-in-time questions ("what was S for quarter Q as published on
+date D?") VintageIndex keeps every vintage of every value and answers with
+binary searches:
+
+-->
+>> from qfr import vintage_index
+>> vintages = vintage_index()
+>> vintages.as_of('QFR101MFGUSNO', '2018-10-01', '2019-10-25')
+>> vintages.snapshot('2019-10-25')       # a Panel of what was known then
+-->
+
+Nothing is read until load_panel() is first called. The CSV files are then
+read on a thread pool, and the panel is saved to qfr_panel.npz in the data
+directory; later calls (in this process or the next) use that file for as
+long as no CSV or metadata file has changed.
+"""
+import glob
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(ROOT, "quarterly-financial-report-u.s.-corporations-data")
+CACHE_NAME = "qfr_panel.npz"
+# Series whose CSV isn't in the data directory: the net sales of the
+# information industry are the repo's quarters.csv.
+EXTRA_FILES = {"QFR101INFUSNO": os.path.join(ROOT, "quarters.csv")}
+_CACHE_VERSION = 1
+_panels = {}
+
+
+def read_series_csv(path):
+    """
+    Returns a dict of the date, realtime_start and realtime_end
+    (datetime64[D]) and value (float) arrays of one series file.
+    FRED writes "." for a missing value, which becomes nan.
+    """
+    with open(path) as f:
+        names = f.readline().strip().split(",")
+        rows = [line.strip().split(",") for line in f if line.strip()]
+    columns = dict(zip(names, zip(*rows))) if rows \
+        else {name: () for name in names}
+    result = {}
+    for name in ("date", "realtime_start", "realtime_end"):
+        result[name] = np.array(columns[name], dtype="datetime64[D]")
+    result["value"] = np.array([np.nan if v == "." else float(v)
+                                for v in columns["value"]])
+    return result
+
+
+def load_catalog(directory=DATA_DIR):
+    """
+    Returns a dict of series id -> metadata for every series that has a
+    metadata file or a CSV, each with a "path" entry for its CSV (None if
+    there is none).
+    """
+    catalog = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*_metadata.json"))):
+        with open(path) as f:
+            for series in json.load(f)["seriess"]:
+                catalog[series["id"]] = dict(series, path=None)
+    for path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+        series_id = os.path.splitext(os.path.basename(path))[0]
+        catalog.setdefault(series_id, {"id": series_id})["path"] = path
+    for series_id, path in EXTRA_FILES.items():
+        if series_id in catalog and catalog[series_id]["path"] is None \
+                and os.path.exists(path):
+            catalog[series_id]["path"] = path
+    return catalog
+
+
+def _signature(catalog, directory):
+    # What the cache was built from: every file's name, size and mtime.
+    paths = glob.glob(os.path.join(directory, "*_metadata.json"))
+    paths += [entry["path"] for entry in catalog.values() if entry["path"]]
+    signature = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        signature.append([os.path.relpath(path, directory), stat.st_size,
+                          stat.st_mtime_ns])
+    return [_CACHE_VERSION, signature]
+
+
+class Panel:
+    """
+    Values of many quarterly series on one date index.
+    values[i, j] is series ids[i] on dates[j], nan where it has no value;
+    realtime_start and realtime_end hold the vintage of each value, NaT
+    where there is none.
+    """
+    def __init__(self, ids, dates, values, realtime_start, realtime_end,
+                 catalog):
+        self.ids = list(ids)
+        self.dates = dates
+        self.values = values
+        self.realtime_start = realtime_start
+        self.realtime_end = realtime_end
+        self.catalog = catalog
+        self._rows = {series_id: i for i, series_id in enumerate(self.ids)}
+
+    def row(self, series_id):
+        return self._rows[series_id]
+
+    def __getitem__(self, series_id):
+        return self.values[self._rows[series_id]]
+
+    def __contains__(self, series_id):
+        return series_id in self._rows
+
+    def __len__(self):
+        return len(self.ids)
+
+    def value(self, series_id, date):
+        """
+        Returns the value of a series in the quarter of date, or nan.
+        """
+        date = np.datetime64(date, "D")
+        j = np.searchsorted(self.dates, date)
+        if j == len(self.dates) or self.dates[j] != date:
+            return np.nan
+        return self.values[self._rows[series_id], j]
+
+    def select(self, series_ids):
+        """
+        Returns the (len(series_ids), quarters) values of those series.
+        """
+        return self.values[[self._rows[i] for i in series_ids]]
+
+    def to_frame(self):
+        """
+        Returns the panel as a pandas DataFrame with a row per quarter and a
+        column per series.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.values.T, index=pd.Index(self.dates,
+                            name="date"), columns=self.ids)
+
+    def __repr__(self):
+        if not len(self.dates):
+            return "<Panel of {0} series, no dates>".format(len(self.ids))
+        return "<Panel of {0} series, {1} quarters from {2} to {3}>".format(
+            len(self.ids), len(self.dates), self.dates[0], self.dates[-1])
+
+
+def _build(catalog, max_workers):
+    ids = sorted(i for i, entry in catalog.items() if entry["path"])
+    with ThreadPoolExecutor(max_workers) as pool:
+        series = list(pool.map(read_series_csv,
+                               [catalog[i]["path"] for i in ids]))
+    if series:
+        dates = np.unique(np.concatenate([s["date"] for s in series]))
+    else:
+        dates = np.array([], dtype="datetime64[D]")
+    values = np.full((len(ids), len(dates)), np.nan)
+    realtime_start = np.full(values.shape, np.datetime64("NaT", "D"))
+    realtime_end = realtime_start.copy()
+    for i, s in enumerate(series):
+        # A series' dates are aligned to the index with one searchsorted:
+        columns = np.searchsorted(dates, s["date"])
+        values[i, columns] = s["value"]
+        realtime_start[i, columns] = s["realtime_start"]
+        realtime_end[i, columns] = s["realtime_end"]
+    return ids, dates, values, realtime_start, realtime_end
+
+
+def load_panel(directory=DATA_DIR, cache=True, max_workers=None):
+    """
+    Returns the Panel of every series in directory that has a CSV file,
+    from qfr_panel.npz when it is up to date.
+    With cache=False the CSV files are read again and nothing is saved.
+    """
+    catalog = load_catalog(directory)
+    signature = json.dumps(_signature(catalog, directory))
+    key = os.path.abspath(directory)
+    if cache and key in _panels and _panels[key][0] == signature:
+        return _panels[key][1]
+
+    cache_path = os.path.join(directory, CACHE_NAME)
+    arrays = None
+    if cache:
+        try:
+            with np.load(cache_path) as data:
+                if str(data["signature"]) == signature:
+                    # tolist() gives str ids, as _build() does, where
+                    # list() would give np.str_ ones.
+                    arrays = (data["ids"].tolist(), data["dates"],
+                              data["values"], data["realtime_start"],
+                              data["realtime_end"])
+        except (OSError, KeyError, ValueError):
+            pass
+    if arrays is None:
+        arrays = _build(catalog, max_workers)
+        if cache:
+            ids, dates, values, realtime_start, realtime_end = arrays
+            buffer = io.BytesIO()
+            np.savez_compressed(buffer, signature=np.array(signature),
+                                ids=np.array(ids), dates=dates, values=values,
+                                realtime_start=realtime_start,
+                                realtime_end=realtime_end)
+            # Another process never loads a half-written cache:
+            temporary = "{0}.{1}.tmp".format(cache_path, os.getpid())
+            with open(temporary, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(temporary, cache_path)
+    panel = Panel(*arrays, catalog=catalog)
+    if cache:
+        _panels[key] = (signature, panel)
+    return panel
+
+
+# VintageIndex packs (series, date, realtime_start) into one sortable int64:
+# the series number, then each date as days from 1970 offset to be positive.
+_DAY_BITS = 18
+_DAY_OFFSET = 1 << (_DAY_BITS - 1)
+
+
+def _days(dates):
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def _pack(codes, dates, known):
+    dates = _days(dates) + _DAY_OFFSET
+    known = _days(known) + _DAY_OFFSET
+    if ((dates < 0) | (dates >> _DAY_BITS != 0)).any() \
+            or ((known < 0) | (known >> _DAY_BITS != 0)).any():
+        raise ValueError("Dates must be within 358 years of 1970")
+    return (np.asarray(codes, dtype=np.int64) << 2 * _DAY_BITS) \
+        | (dates << _DAY_BITS) | known
+
+
+class VintageIndex:
+    """
+    Every vintage of every value of some series: the value of series ids[s]
+    for the observation date d that was current from realtime_start to
+    realtime_end (both inclusive, like FRED; an end of 9999-12-31 means it
+    still is).
+    The records are kept sorted by series, date and realtime_start, so each
+    lookup is one binary search.
+    A file downloaded from FRED ends its current vintages on the day it was
+    downloaded; with open_ended (the default) the vintages ending on the
+    latest realtime_end of all count as still current after it.
+    """
+    def __init__(self, series, dates, realtime_start, realtime_end, values,
+                 catalog=None, open_ended=True):
+        self.ids = sorted(set(series))
+        self._codes = {series_id: i for i, series_id in enumerate(self.ids)}
+        codes = np.array([self._codes[s] for s in series], dtype=np.int64)
+        keys = _pack(codes, dates, realtime_start)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.realtime_end = _days(realtime_end)[order]
+        if open_ended and len(self.realtime_end):
+            latest = self.realtime_end == self.realtime_end.max()
+            self.realtime_end[latest] = _days("9999-12-31")
+        self.values = np.asarray(values, dtype=float)[order]
+        self.dates = np.unique(np.asarray(dates, dtype="datetime64[D]"))
+        self.catalog = catalog if catalog is not None \
+            else {series_id: {"id": series_id} for series_id in self.ids}
+
+    @classmethod
+    def from_files(cls, paths, catalog=None, max_workers=None,
+                   open_ended=True):
+        """
+        Builds the index from a dict of series id -> CSV path, such as
+        {'QFR101INFUSNO': 'quarters.csv'}.
+        """
+        ids = list(paths)
+        with ThreadPoolExecutor(max_workers) as pool:
+            tables = list(pool.map(read_series_csv, [paths[i] for i in ids]))
+        series = []
+        for series_id, table in zip(ids, tables):
+            series += [series_id] * len(table["value"])
+        columns = {}
+        for name in ("date", "realtime_start", "realtime_end", "value"):
+            columns[name] = np.concatenate(
+                [table[name] for table in tables]) if tables else []
+        return cls(series, columns["date"], columns["realtime_start"],
+                   columns["realtime_end"], columns["value"], catalog,
+                   open_ended)
+
+    def as_of(self, series, dates, known_on):
+        """
+        Returns the value of series for the observation dates as it was
+        known on known_on: the vintage whose realtime_start is the latest
+        one not after known_on, if its realtime_end isn't before known_on.
+        The arguments broadcast against each other, so a whole backtest can
+        be one call; values that weren't published yet are nan.
+        """
+        series, dates, known_on = np.broadcast_arrays(
+            np.asarray(series, dtype=object), np.asarray(dates),
+            np.asarray(known_on))
+        # Look each distinct series up once, however many queries name it:
+        names, inverse = np.unique(series.astype(str), return_inverse=True)
+        codes = np.array([self._codes.get(s, -1) for s in names],
+                         dtype=np.int64)[inverse].reshape(series.shape)
+        if not len(self.keys):
+            codes = np.full(series.shape, -1, dtype=np.int64)
+        queries = _pack(np.maximum(codes, 0), dates, known_on)
+        found = np.maximum(np.searchsorted(self.keys, queries, "right") - 1, 0)
+        keys = self.keys[found] if len(self.keys) else queries
+        # The vintage found must be for the same series and date, and still
+        # current on known_on:
+        valid = (codes >= 0) & (keys <= queries) \
+            & (keys >> _DAY_BITS == queries >> _DAY_BITS)
+        values = self.values[found] if len(self.keys) else np.nan
+        ends = self.realtime_end[found] if len(self.keys) else 0
+        result = np.where(valid & (ends >= _days(known_on)), values, np.nan)
+        return result if result.ndim else float(result)
+
+    def vintages(self, series_id, date):
+        """
+        Returns the (realtime_start, realtime_end, value) of every vintage of
+        one value, oldest first.
+        """
+        prefix = _pack(self._codes[series_id], date, "1970-01-01") \
+            >> _DAY_BITS
+        lo = np.searchsorted(self.keys, prefix << _DAY_BITS, "left")
+        hi = np.searchsorted(self.keys, (prefix + 1) << _DAY_BITS, "left")
+        starts = (self.keys[lo:hi] & ((1 << _DAY_BITS) - 1)) - _DAY_OFFSET
+        return list(zip(starts.astype("datetime64[D]"),
+                        self.realtime_end[lo:hi].astype("datetime64[D]"),
+                        self.values[lo:hi]))
+
+    def snapshot(self, known_on, series_ids=None):
+        """
+        Returns a Panel of the values of series_ids (by default all) as they
+        were known on known_on.
+        """
+        ids = self.ids if series_ids is None else list(series_ids)
+        grid = np.array(ids, dtype=object)[:, None]
+        values = self.as_of(grid, self.dates[None, :], known_on)
+        known = np.full(values.shape, np.datetime64(known_on, "D"))
+        known[np.isnan(values)] = np.datetime64("NaT")
+        return Panel(ids, self.dates, values, known, known.copy(),
+                     {i: self.catalog.get(i, {"id": i}) for i in ids})
+
+
+def vintage_index(directory=DATA_DIR, max_workers=None):
+    """
+    Returns the VintageIndex of every series in directory with a CSV file.
+    """
+    catalog = load_catalog(directory)
+    paths = {i: entry["path"] for i, entry in catalog.items() if entry["path"]}
+    return VintageIndex.from_files(paths, catalog, max_workers)
@@ -0,0 +1,187 @@
+"""
+Incremental log-return statistics for a price file that grows during the day.
+
+basic_analysis.py recomputes every log return and the standard deviation
+from the whole of AAPL_data.csv on every run.
+ReturnStats instead keeps a running mean and variance (Welford's method)
+for the whole history and for a few rolling windows of the latest returns.
+Each new bar updates every window in O(1), and the state is saved to a small
+JSON file together with how far into the CSV it has read, so the next run
+only reads the rows appended since.
+
+-->
+>> stats = ReturnStats.load_or_create("AAPL_data.stats.json", windows=(4, 13, 52))
+>> stats.update_from_csv("AAPL_data.csv")
+>> stats.save("AAPL_data.stats.json")
+>> print(stats)
+-->
+"""
+import json
+import math
+import os
+
+
+class WindowStats:
+    """
+    Running count, mean and sum of squared deviations (m2) of the latest
+    window values, or of every value when window is None.
+    """
+    def __init__(self, window=None, count=0, mean=0.0, m2=0.0):
+        self.window = window
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def replace(self, old, new):
+        """
+        Slides a full window along: old leaves it as new comes in.
+        """
+        delta = new - old
+        mean = self.mean + delta / self.count
+        self.m2 += delta * (new - mean + old - self.mean)
+        self.mean = mean
+        # Rounding can leave a tiny negative m2 for a constant series:
+        if self.m2 < 0:
+            self.m2 = 0.0
+
+    def variance(self, ddof=0):
+        """
+        The variance, by default the population variance like np.std uses.
+        """
+        if self.count <= ddof:
+            return math.nan
+        return self.m2 / (self.count - ddof)
+
+    def stdev(self, ddof=0):
+        return math.sqrt(self.variance(ddof))
+
+    def to_dict(self):
+        return {"window": self.window, "count": self.count,
+                "mean": self.mean, "m2": self.m2}
+
+
+class ReturnStats:
+    """
+    Log-return statistics over the whole history and over rolling windows
+    of the given numbers of bars.
+    """
+    def __init__(self, windows=(4, 13, 52), column="Adj Close"):
+        self.column = column
+        self.last_price = None
+        self.bars = 0
+        self.total = WindowStats()
+        self.windows = [WindowStats(w) for w in sorted(windows)]
+        # The latest returns, as a ring buffer as long as the longest window:
+        self.history = []
+        self.position = 0
+        # How far update_from_csv has read, and the CSV column it uses:
+        self.offset = 0
+        self.column_index = None
+
+    def update(self, price):
+        """
+        Adds the next closing price.
+        """
+        self.bars += 1
+        if self.last_price is not None:
+            self.add_return(math.log(price / self.last_price))
+        self.last_price = price
+
+    def add_return(self, x):
+        history = self.history
+        size = len(history)
+        for stats in self.windows:
+            if stats.count < stats.window:
+                stats.add(x)
+            else:
+                # The return leaving the window is the one stats.window bars
+                # back from the newest:
+                stats.replace(history[(self.position - stats.window) % size],
+                              x)
+        self.total.add(x)
+        longest = self.windows[-1].window if self.windows else 0
+        if size < longest:
+            history.append(x)
+        elif longest:
+            history[self.position] = x
+            self.position = (self.position + 1) % longest
+
+    def update_from_csv(self, path):
+        """
+        Reads the rows appended to the CSV file at path since the last call
+        and returns how many bars were added.
+        If the file is now shorter than what was already read it has been
+        replaced, and everything is read again from the start.
+        """
+        if os.path.getsize(path) < self.offset:
+            self.__init__([w.window for w in self.windows], self.column)
+        added = 0
+        with open(path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Leave a partly written last line for next time:
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].decode().splitlines()
+        self.offset += end
+        if self.column_index is None and lines:
+            self.column_index = lines.pop(0).split(",").index(self.column)
+        for line in lines:
+            if line:
+                self.update(float(line.split(",")[self.column_index]))
+                added += 1
+        return added
+
+    def save(self, path):
+        state = {"column": self.column, "last_price": self.last_price,
+                 "bars": self.bars, "offset": self.offset,
+                 "column_index": self.column_index,
+                 "total": self.total.to_dict(),
+                 "windows": [w.to_dict() for w in self.windows],
+                 # Oldest first, so loading doesn't need the ring position:
+                 "history": self.history[self.position:]
+                 + self.history[:self.position]}
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        stats = cls([w["window"] for w in state["windows"]], state["column"])
+        stats.last_price = state["last_price"]
+        stats.bars = state["bars"]
+        stats.offset = state["offset"]
+        stats.column_index = state["column_index"]
+        stats.total = WindowStats(**state["total"])
+        stats.windows = [WindowStats(**w) for w in state["windows"]]
+        stats.history = state["history"]
+        return stats
+
+    @classmethod
+    def load_or_create(cls, path, windows=(4, 13, 52), column="Adj Close"):
+        """
+        Loads the saved state at path, or starts afresh if there is none or
+        it was kept for other windows or another column.
+        """
+        if os.path.exists(path):
+            stats = cls.load(path)
+            if [w.window for w in stats.windows] == sorted(windows) \
+                    and stats.column == column:
+                return stats
+        return cls(windows, column)
+
+    def __str__(self):
+        lines = ["{0} bars, all returns: mean {1:.6f}, stdev {2:.6f}"
+                 .format(self.bars, self.total.mean, self.total.stdev())]
+        for w in self.windows:
+            lines.append("last {0} returns: mean {1:.6f}, stdev {2:.6f}"
+                         .format(w.window, w.mean, w.stdev()))
+        return "\n".join(lines)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from frontier import efficient_frontier, optimal_portfolio
+
+
+def test_more_assets_than_observations():
+    # 20 observations of 40 assets: the sample covariance has rank 19.
+    returns = np.random.default_rng(1).normal(0.01, 0.05, (20, 40))
+    weights, expected, risks = optimal_portfolio(returns, points=15)
+    assert np.allclose(weights.sum(axis=1), 1)
+    assert (weights >= -1e-12).all()
+    assert (np.diff(expected) > 0).all()
+    assert (np.diff(risks) >= -1e-12).all()
+    # The minimum variance portfolio, as found by a QP solver:
+    assert risks[0] == pytest.approx(0.00099928161186, rel=1e-6)
+
+
+def test_zero_variance_asset():
+    returns = np.random.default_rng(2).normal(0.01, 0.05, (60, 5))
+    returns[:, 2] = 0.002
+    weights, expected, risks = optimal_portfolio(returns, points=10)
+    # The least risky portfolio is all cash.
+    assert weights[0] == pytest.approx([0, 0, 1, 0, 0], abs=1e-6)
+    assert risks[0] == pytest.approx(0, abs=1e-6)
+    assert expected[-1] == pytest.approx(returns.mean(axis=0).max())
+
+
+def test_positive_definite_covariance_is_unchanged():
+    mu = np.array([0.05, 0.08, 0.12])
+    cov = np.array([[0.04, 0.01, 0.0], [0.01, 0.09, 0.02], [0.0, 0.02, 0.16]])
+    assert efficient_frontier(mu, cov, 5, ridge=1.0)[0] == pytest.approx(
+        efficient_frontier(mu, cov, 5)[0])
+
+
+def test_tied_best_returns():
+    # Both assets with the best return belong in the top portfolio, mixed
+    # 1:2 for the least variance.
+    mu = np.array([0.1, 0.1, 0.05])
+    cov = np.diag([0.04, 0.02, 0.01])
+    weights, expected, risks = efficient_frontier(mu, cov, 7)
+    assert weights[-1] == pytest.approx([1 / 3, 2 / 3, 0])
+    assert expected[-1] == pytest.approx(0.1)
+    # The minimum-variance portfolio for each return, by Lagrange
+    # multipliers, since no weight is zero along the way:
+    inverse = np.linalg.inv(cov)
+    ones = np.ones(3)
+    a, b, c = ones @ inverse @ ones, ones @ inverse @ mu, mu @ inverse @ mu
+    best = np.sqrt((a * expected ** 2 - 2 * b * expected + c)
+                   / (a * c - b ** 2))
+    assert risks == pytest.approx(best)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from net_present_value import irr, project_a, project_b
+
+
+def test_irr_of_flat_cash_flows_is_zero():
+    # The payments add up to exactly the outlay, so the IRR is 0.
+    assert irr([[-1000] + [10.0] * 100])[0] == pytest.approx(0, abs=1e-9)
+
+
+def test_irr_ignores_trailing_zero_periods():
+    rates = irr([[-1000] + [10.0] * 100, [-1000] + [10.0] * 100 + [0] * 200])
+    assert rates == pytest.approx([0, 0], abs=1e-9)
+
+
+def test_irr_of_long_project_is_a_root():
+    flows = [-1000] + [12.0] * 299
+    rate = irr([flows])[0]
+    assert 0 < rate < 0.02
+    discounted = sum(c / (1 + rate) ** t for t, c in enumerate(flows))
+    assert discounted == pytest.approx(0, abs=1e-6)
+
+
+def test_irr_of_single_late_payment():
+    rate = irr([[-1000] + [0] * 50 + [1e6]])[0]
+    assert rate == pytest.approx(1000 ** (1 / 51) - 1, rel=1e-12)
+
+
+def test_irr_of_the_two_projects():
+    assert irr([project_a, project_b]) == pytest.approx(
+        [0.14767253, 0.16836195], abs=1e-8)
+
+
+def test_irr_without_a_sign_change_is_nan():
+    assert np.isnan(irr([[1, 2, 3]])[0])
+
+
+def test_irr_not_converged_is_nan():
+    assert np.isnan(irr([[-1000] + [10.0] * 100], max_iter=2)[0])
+
+
+def test_irr_with_negative_terminal_cash_flow():
+    # The NPV is negative at both ends of the default range, with a root
+    # at about 0.1029 (and another near -0.92) in between.
+    rate = irr([[-100, 60, 60, -5]])[0]
+    assert rate == pytest.approx(0.10289, abs=1e-4)
+    assert sum(c / (1 + rate) ** t
+               for t, c in enumerate([-100, 60, 60, -5])) == pytest.approx(
+                   0, abs=1e-9)
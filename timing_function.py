@@ -28,3 +28,11 @@ def sum_numbers():
 # want to set a timing benchmark for.
 
 print(sum_numbers())
+
+# timing_function times a single call with time.time() and drops the
+# function's arguments and return value. For numbers worth comparing, use
+# benchmark.measure, which warms up, repeats and reports the median and IQR.
+
+from benchmark import measure
+
+print(measure(sum, args=(range(0, 10000),), name="sum(range(10000))"))